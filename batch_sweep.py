@@ -0,0 +1,168 @@
+import pandas as pd
+import argparse
+import asyncio
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import perform_wilcoxon_tests
+import ibs_data
+from wide_scores import build_wide_scores
+
+# Dataset shared by every configuration run in this process. The parent
+# loads it before the pool starts, so forked workers inherit it for free;
+# other start methods load it once per worker in init_worker().
+shared_df = None
+shared_wide_scores = None
+
+def init_worker(source='flat'):
+    """Load the dataset once per worker process (no-op if inherited)."""
+    global shared_df, shared_wide_scores
+    if shared_df is None:
+        shared_df = ibs_data.load_data(source)
+        shared_wide_scores = build_wide_scores(shared_df)
+
+def run_configuration(config):
+    """Run the baseline Wilcoxon tests for one configuration of the grid."""
+    results_df = perform_wilcoxon_tests.generate_results_table(
+        shared_df,
+        alpha=config['Alpha'],
+        baseline=config['Baseline'],
+        treatments=config['Treatments'],
+        follow_ups=config['Follow-ups'],
+        wide_scores=shared_wide_scores,
+    )
+    # Tidy output: one row per test, prefixed with the configuration
+    for column, value in reversed(list(config.items())):
+        if value is None:
+            value = 'all'
+        elif isinstance(value, tuple):
+            value = '+'.join(str(v) for v in value)
+        results_df.insert(0, column, value)
+    return results_df
+
+def build_grid(alphas, baselines, arm_sets, follow_up_sets):
+    """All combinations of the sweep parameters, each with a Config ID."""
+    grid = []
+    for config_id, (alpha, baseline, treatments, follow_ups) in enumerate(
+            itertools.product(alphas, baselines, arm_sets, follow_up_sets)):
+        grid.append({
+            'Config ID': config_id,
+            'Alpha': alpha,
+            'Baseline': baseline,
+            'Treatments': treatments,
+            'Follow-ups': follow_ups,
+        })
+    return grid
+
+async def run_sweep(grid, output_file, workers, retries, source='flat'):
+    """Schedule every configuration on the pool and stream results to CSV.
+
+    Failed configurations are resubmitted up to `retries` times. If a
+    worker process dies, the pool is broken for every job still on it, so
+    it is replaced with a fresh pool before those jobs are retried.
+    Returns the configurations that still failed.
+    """
+    if retries < 0:
+        raise ValueError(f"retries must be >= 0, got {retries}")
+
+    # Never leave a previous sweep's results behind, even if this one produces none
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    loop = asyncio.get_running_loop()
+    completed = 0
+    failed = []
+    header_written = False
+    start = time.time()
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(source,))
+
+    executor = new_pool()
+
+    async def run_with_retries(config):
+        nonlocal executor
+        for attempt in range(retries + 1):
+            pool = executor
+            try:
+                return config, await loop.run_in_executor(pool, run_configuration, config)
+            except BrokenProcessPool as error:
+                last_error = error
+                # The first job to see the broken pool replaces it for everyone
+                if executor is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    executor = new_pool()
+                    print(f"Worker pool broke during config {config['Config ID']}; restarted it")
+            except Exception as error:
+                last_error = error
+        return config, last_error
+
+    try:
+        for task in asyncio.as_completed([run_with_retries(config) for config in grid]):
+            config, result = await task
+            completed += 1
+            if isinstance(result, Exception):
+                failed.append((config, result))
+            elif not result.empty:
+                # Append each finished configuration as soon as it arrives
+                result.to_csv(output_file, mode='a' if header_written else 'w',
+                              header=not header_written, index=False)
+                header_written = True
+            print(f"[{completed}/{len(grid)}] config {config['Config ID']} "
+                  f"{'failed' if isinstance(result, Exception) else 'done'} "
+                  f"({time.time() - start:.1f}s)")
+    finally:
+        executor.shutdown()
+
+    return failed
+
+def parse_float_list(value):
+    return [float(v) for v in value.split(',')]
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',')]
+
+def parse_arm_sets(value):
+    """'FMT+PLACEBO,FMT' -> [('FMT', 'PLACEBO'), ('FMT',)]"""
+    return [tuple(arm.upper() for arm in arm_set.split('+')) for arm_set in value.split(',')]
+
+def parse_follow_up_sets(value):
+    """'all,1+4' -> [None, (1, 4)]"""
+    return [None if s == 'all' else tuple(int(v) for v in s.split('+')) for s in value.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Sweep the Wilcoxon analysis over a grid of parameters in one job.")
+    parser.add_argument('--alphas', type=parse_float_list, default=[0.05], help="Comma-separated significance levels")
+    parser.add_argument('--baselines', type=parse_int_list, default=[0], help="Comma-separated baseline sessions")
+    parser.add_argument('--arms', type=parse_arm_sets, default=[('FMT', 'PLACEBO')],
+                        help="Comma-separated treatment subsets, arms joined by '+' (e.g. FMT+PLACEBO,FMT)")
+    parser.add_argument('--follow-ups', type=parse_follow_up_sets, default=[None],
+                        help="Comma-separated follow-up subsets joined by '+', or 'all' (e.g. all,4,1+4)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument('--retries', type=int, default=2, help="Retries per failed configuration")
+    parser.add_argument('--output', default='results/batch_sweep_results.csv', help="Tidy results CSV")
+    ibs_data.add_source_argument(parser)
+    args = parser.parse_args()
+    if args.retries < 0:
+        parser.error("--retries must be 0 or more")
+
+    # Load once in the parent so forked workers share it
+    init_worker(args.source)
+
+    # Create results directory if it doesn't exist
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+
+    grid = build_grid(args.alphas, args.baselines, args.arms, args.follow_ups)
+    print(f"Running {len(grid)} configurations...")
+    failed = asyncio.run(run_sweep(grid, args.output, args.workers, args.retries, args.source))
+
+    if os.path.exists(args.output):
+        print(f"\nResults have been saved to: {args.output}")
+    else:
+        print("\nNo results were produced.")
+    if failed:
+        print(f"{len(failed)} configurations failed after {args.retries} retries:")
+        for config, error in failed:
+            print(f"  config {config['Config ID']}: {error!r}")
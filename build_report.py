@@ -0,0 +1,265 @@
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import ibs_data
+import generate_summary_tables
+import perform_wilcoxon_tests
+import wilcoxon_baseline_comparison
+from generate_summary_tables import style_table
+
+PARTS_DIR = 'results/report_parts'
+MANIFEST_FILE = os.path.join(PARTS_DIR, 'manifest.json')
+
+# Every table is rendered by build_table(), which uses style_table from generate_summary_tables.py
+TABLE_SOURCES = ['build_report.py', 'generate_summary_tables.py']
+
+# Figures are produced by the existing plot scripts, in report order
+FIGURES = [
+    {'id': 'scores-with-avg', 'script': 'plot_scores_with_avg.py',
+     'output': 'results/all_surveys_scores_with_avg_plot.png',
+     'caption': 'Patient total scores over time with group means and ±1 SD, by survey and treatment.'},
+    {'id': 'scores-lines-only', 'script': 'plot_scores_lines_only.py',
+     'output': 'results/all_surveys_scores_lines_only.png',
+     'caption': 'Mean total scores over time by survey and treatment.'},
+    {'id': 'scores-combined', 'script': 'plot_scores_vert.py',
+     'output': 'results/all_surveys_scores_plot_combined.png',
+     'caption': 'Individual patient total scores over time by survey and treatment.'},
+    {'id': 'scores-start-end', 'script': 'plot_scores_hor.py',
+     'output': 'results/all_surveys_start_end_plot.png',
+     'caption': 'Patient total scores at baseline (0 months) and end of study (12 months).'},
+]
+
+def file_digest(paths):
+    """SHA-256 over the contents of several files, used to detect changed components."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def table_components(df):
+    """Table components in report order, one summary table per survey first."""
+    components = []
+    for survey_name in sorted(df['survey_name'].unique()):
+        components.append({
+            'id': f'summary-{survey_name.lower()}',
+            'caption': f'{survey_name} total and category scores by follow-up and group (mean±SD).',
+            'build': lambda df, survey_name=survey_name: (
+                generate_summary_tables.build_summary_table(df, survey_name), None),
+            'sources': ['generate_summary_tables.py'],
+            'image': f'results/summary-table-{survey_name.lower()}.png',
+        })
+    components.append({
+        'id': 'wilcoxon-signed-rank-test-results',
+        'caption': 'Wilcoxon signed rank test of each follow-up against baseline, by survey and treatment group.',
+        'build': lambda df: (perform_wilcoxon_tests.generate_results_table(df), None),
+        'sources': ['perform_wilcoxon_tests.py', 'wide_scores.py', 'generate_summary_tables.py'],
+        'image': 'results/summary-table-wilcoxon-signed-rank-test-results.png',
+    })
+    components.append({
+        'id': 'wilcoxon-baseline',
+        'caption': 'Wilcoxon signed rank test results: comparison to baseline.',
+        'build': build_wilcoxon_baseline,
+        'sources': ['wilcoxon_baseline_comparison.py', 'wide_scores.py', 'effect_sizes.py', 'random_streams.py'],
+        'image': 'results/summary-table-wilcoxon-baseline.png',
+    })
+    return components
+
+def build_wilcoxon_baseline(df):
+    """Baseline comparison table, keeping the paper's own LaTeX layout."""
+    results_df = wilcoxon_baseline_comparison.generate_results_table(df)
+    latex = wilcoxon_baseline_comparison.generate_latex_table(results_df)
+    # Let the report own the caption and numbering
+    latex = latex.replace("\\caption{Wilcoxon Signed Rank Test Results: Comparison to Baseline}\n", "")
+    latex = latex.replace("\\label{tab:wilcoxon_baseline}\n", "")
+    latex = latex.replace("\\begin{table}[htbp]\n\\centering\n", "").replace("\n\\end{table}", "")
+    return results_df.round(3), latex
+
+def escape_latex(value):
+    """Escape the LaTeX special characters that occur in our tables."""
+    text = str(value)
+    for char, replacement in [('\\', '\\textbackslash{}'), ('&', '\\&'), ('%', '\\%'),
+                              ('_', '\\_'), ('#', '\\#'), ('±', '$\\pm$')]:
+        text = text.replace(char, replacement)
+    return text
+
+def latex_tabular(table_df):
+    """Tabular body for a table, in the same style as wilcoxon_baseline_table.tex."""
+    lines = []
+    lines.append("\\begin{tabular}{" + "l" * len(table_df.columns) + "}")
+    lines.append("\\hline")
+    lines.append(" & ".join(escape_latex(col) for col in table_df.columns) + " \\\\")
+    lines.append("\\hline")
+    for row in table_df.itertuples(index=False):
+        lines.append(" & ".join("---" if pd.isna(value) else escape_latex(value) for value in row) + " \\\\")
+    lines.append("\\hline")
+    lines.append("\\end{tabular}")
+    return "\n".join(lines)
+
+def render_table_image(table_df, output_file):
+    """Draw a table straight to PNG, replacing the hand-made screenshots.
+
+    Uses a bare Figure rather than pyplot so it is safe to call from threads.
+    """
+    n_rows, n_cols = table_df.shape
+    fig = Figure(figsize=(max(6, 1.6 * n_cols), 0.4 * (n_rows + 1) + 0.2))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.axis('off')
+
+    cell_text = [["---" if pd.isna(value) else str(value) for value in row]
+                 for row in table_df.itertuples(index=False)]
+    table = ax.table(cellText=cell_text, colLabels=list(table_df.columns), loc='center', cellLoc='center')
+    table.auto_set_font_size(False)
+    table.set_fontsize(9)
+    table.scale(1, 1.4)
+
+    # Match the HTML tables: grey bold header, striped rows
+    for (row, col), cell in table.get_celld().items():
+        if row == 0:
+            cell.set_facecolor('#f0f0f0')
+            cell.set_text_props(fontweight='bold')
+        elif row % 2 == 1:
+            cell.set_facecolor('#f9f9f9')
+
+    fig.savefig(output_file, bbox_inches='tight', dpi=200)
+
+def build_table(component, df):
+    """Build one table component and write its HTML/LaTeX fragments and image."""
+    table_df, latex = component['build'](df)
+    if latex is None:
+        latex = latex_tabular(table_df)
+
+    render_table_image(table_df, component['image'])
+    html = style_table(table_df).to_html()
+    with open(os.path.join(PARTS_DIR, f"{component['id']}.html"), 'w') as f:
+        f.write(html)
+    with open(os.path.join(PARTS_DIR, f"{component['id']}.tex"), 'w') as f:
+        f.write(latex)
+    return component['id']
+
+def build_figure(script, source):
+    """Run one plot script in this worker process (output goes to results/)."""
+    os.environ['MPLBACKEND'] = 'Agg'
+    sys.argv = [script, '--source', source]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        runpy.run_path(script, run_name='__main__')
+    return script
+
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def is_current(manifest, component_id, digest, outputs):
+    """True if the component was built from the same inputs and its outputs still exist."""
+    return manifest.get(component_id) == digest and all(os.path.exists(path) for path in outputs)
+
+def assemble_html(tables, figures, output_file):
+    """Single HTML report with tables and figures numbered in order."""
+    with open(output_file, 'w') as f:
+        f.write("<html><head><meta charset='utf-8'><title>IBS FMT Study Results</title></head><body>")
+        f.write("<h1>IBS FMT Study Results</h1>")
+        for number, component in enumerate(tables, start=1):
+            with open(os.path.join(PARTS_DIR, f"{component['id']}.html")) as part:
+                f.write(f"<h3 id='tab-{component['id']}'>Table {number}. {component['caption']}</h3>")
+                f.write(part.read())
+        for number, figure in enumerate(figures, start=1):
+            f.write(f"<figure id='fig-{figure['id']}'>")
+            f.write(f"<img src='{os.path.basename(figure['output'])}' style='max-width:100%'>")
+            f.write(f"<figcaption>Figure {number}. {figure['caption']}</figcaption></figure>")
+        f.write("</body></html>")
+
+def assemble_latex(tables, figures, output_file):
+    """LaTeX include file with the same table and figure order as the HTML report."""
+    lines = ["% Generated by build_report.py -- include with \\input{results/report.tex}",
+             "% Figures are referenced by file name; add \\graphicspath{{results/}} to the preamble.", ""]
+    for component in tables:
+        with open(os.path.join(PARTS_DIR, f"{component['id']}.tex")) as part:
+            lines.append("\\begin{table}[htbp]")
+            lines.append("\\centering")
+            lines.append(f"\\caption{{{escape_latex(component['caption'])}}}")
+            lines.append(f"\\label{{tab:{component['id']}}}")
+            lines.append(part.read())
+            lines.append("\\end{table}")
+            lines.append("")
+    for figure in figures:
+        lines.append("\\begin{figure}[htbp]")
+        lines.append("\\centering")
+        lines.append(f"\\includegraphics[width=\\textwidth]{{{os.path.basename(figure['output'])}}}")
+        lines.append(f"\\caption{{{escape_latex(figure['caption'])}}}")
+        lines.append(f"\\label{{fig:{figure['id']}}}")
+        lines.append("\\end{figure}")
+        lines.append("")
+    with open(output_file, 'w') as f:
+        f.write("\n".join(lines))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build all tables and figures into one HTML report and one LaTeX include file.")
+    parser.add_argument('--force', action='store_true', help="Rebuild every component, even if unchanged")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes for figures (default: all cores)")
+    ibs_data.add_source_argument(parser)
+    args = parser.parse_args()
+
+    df = ibs_data.load_data(args.source)
+    input_files = ibs_data.source_files(args.source) + ['ibs_data.py']
+
+    # Create results directories if they don't exist
+    os.makedirs(PARTS_DIR, exist_ok=True)
+
+    manifest = {} if args.force else load_manifest()
+    new_manifest = {}
+    tables = table_components(df)
+
+    # Tables share the loaded data on threads, figures run as separate processes.
+    # Figure workers are spawned, not forked: forking while table threads hold locks can deadlock.
+    figure_context = multiprocessing.get_context('spawn')
+    with ThreadPoolExecutor() as table_pool, \
+            ProcessPoolExecutor(max_workers=args.workers, mp_context=figure_context) as figure_pool:
+        futures = []
+        for component in tables:
+            digest = file_digest(input_files + TABLE_SOURCES + component['sources'])
+            new_manifest[component['id']] = digest
+            outputs = [component['image'],
+                       os.path.join(PARTS_DIR, f"{component['id']}.html"),
+                       os.path.join(PARTS_DIR, f"{component['id']}.tex")]
+            if is_current(manifest, component['id'], digest, outputs):
+                print(f"Reusing table {component['id']}")
+                continue
+            futures.append(table_pool.submit(build_table, component, df))
+
+        for figure in FIGURES:
+            digest = file_digest(input_files + [figure['script']])
+            new_manifest[figure['id']] = digest
+            if is_current(manifest, figure['id'], digest, [figure['output']]):
+                print(f"Reusing figure {figure['id']}")
+                continue
+            futures.append(figure_pool.submit(build_figure, figure['script'], args.source))
+
+        for future in futures:
+            print(f"Built {future.result()}")
+
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump(new_manifest, f, indent=2)
+
+    assemble_html(tables, FIGURES, 'results/report.html')
+    assemble_latex(tables, FIGURES, 'results/report.tex')
+
+    print(f"\nReport has been saved to:")
+    print(f"1. HTML report: results/report.html")
+    print(f"2. LaTeX include file: results/report.tex")
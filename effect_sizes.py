@@ -0,0 +1,330 @@
+import numpy as np
+from scipy import stats
+
+import random_streams
+
+# Above this many differences the Walsh averages are not materialized;
+# their order statistics are found by bisection with sorted-merge counts
+MAX_MATERIALIZED_N = 500
+
+# Most Walsh averages (or value counts) held in memory at once when working in batches
+MAX_WALSH_BATCH = 1_000_000
+
+# Largest n for which the exact signed-rank null distribution is used for the CI
+MAX_EXACT_N = 50
+
+def pad_cells(arrays):
+    """Stack arrays of different lengths into one NaN-padded (cells x max n) matrix."""
+    width = max((len(a) for a in arrays), default=0)
+    padded = np.full((len(arrays), width), np.nan)
+    for i, values in enumerate(arrays):
+        padded[i, :len(values)] = values
+    return padded
+
+def drop_nan(values):
+    values = np.asarray(values, dtype=float)
+    return values[~np.isnan(values)]
+
+def rank_biserial(differences):
+    """Matched-pairs rank-biserial correlation for every cell at once.
+
+    `differences` is a NaN-padded (cells x n) matrix of follow-up minus
+    baseline. Zero differences are dropped, as in the Wilcoxon test. Returns
+    (R+ - R-) / (R+ + R-): +1 when every patient increased, -1 when every
+    patient decreased.
+    """
+    differences = np.atleast_2d(np.asarray(differences, dtype=float))
+    nonzero = np.where(differences == 0, np.nan, differences)
+    ranks = stats.rankdata(np.abs(nonzero), axis=1, nan_policy='omit')
+    positive = np.nansum(np.where(nonzero > 0, ranks, 0), axis=1)
+    negative = np.nansum(np.where(nonzero < 0, ranks, 0), axis=1)
+    total = positive + negative
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(total > 0, (positive - negative) / total, np.nan)
+
+def count_walsh_at_most(sorted_values, threshold):
+    """Number of Walsh averages (x_i + x_j) / 2, i <= j, that are <= threshold.
+
+    One searchsorted pass over the sorted values: for each i, the partners
+    j >= i with x_j <= 2 * threshold - x_i.
+    """
+    n = len(sorted_values)
+    upper = np.searchsorted(sorted_values, 2 * threshold - sorted_values, side='right')
+    return int(np.maximum(upper - np.arange(n), 0).sum())
+
+def kth_walsh_average(sorted_values, k):
+    """k-th smallest (1-based) Walsh average of sorted values."""
+    n = len(sorted_values)
+    if n <= MAX_MATERIALIZED_N:
+        rows, cols = np.triu_indices(n)
+        walsh = (sorted_values[rows] + sorted_values[cols]) / 2
+        return float(np.partition(walsh, k - 1)[k - 1])
+
+    # Bisection on the value, counting with sorted-merge passes instead of
+    # building all n(n+1)/2 averages
+    low, high = sorted_values[0], sorted_values[-1]
+    for _ in range(100):
+        mid = (low + high) / 2
+        if mid in (low, high):
+            break
+        if count_walsh_at_most(sorted_values, mid) >= k:
+            high = mid
+        else:
+            low = mid
+
+    # Snap to the largest Walsh average <= high, i.e. the exact order statistic
+    partners = np.searchsorted(sorted_values, 2 * high - sorted_values, side='right') - 1
+    has_partner = partners >= np.arange(n)
+    candidates = (sorted_values[has_partner] + sorted_values[partners[has_partner]]) / 2
+    return float(candidates.max())
+
+def walsh_median(sorted_values):
+    """Median of the Walsh averages of sorted values (the Hodges-Lehmann estimate)."""
+    n_walsh = len(sorted_values) * (len(sorted_values) + 1) // 2
+    return (kth_walsh_average(sorted_values, (n_walsh + 1) // 2) +
+            kth_walsh_average(sorted_values, (n_walsh + 2) // 2)) / 2
+
+def bootstrap_counts(values, n_boot, root_seed, stream_key):
+    """How often each distinct value occurs in each of `n_boot` resamples.
+
+    `values` are sorted. Resamples are drawn chunk by chunk from the random
+    stream named by stream_key = (analysis, survey, arm, follow_up).
+    Returns an (n_boot x distinct values) matrix.
+    """
+    n = len(values)
+    codes = np.unique(values, return_inverse=True)[1].ravel()
+    n_distinct = codes.max() + 1
+    analysis, survey, arm, follow_up = stream_key or ('effect_sizes', 'ALL', 'ALL', 0)
+    counts = []
+    for chunk, size in random_streams.chunk_sizes(n_boot):
+        rng = random_streams.generator(root_seed, analysis, survey, arm, follow_up, chunk)
+        drawn = codes[rng.integers(0, n, size=(size, n))] + np.arange(size)[:, None] * n_distinct
+        counts.append(np.bincount(drawn.ravel(), minlength=size * n_distinct).reshape(size, n_distinct))
+    return np.concatenate(counts)
+
+def walsh_medians_from_counts(distinct_sets, count_sets):
+    """Walsh median of every sample of every cell, with samples given as value counts.
+
+    distinct_sets[c] holds the sorted distinct values of cell c and
+    count_sets[c] a (samples x distinct) matrix of how often each value
+    occurs in each sample. The Walsh averages are counted, never built:
+    a k-th average is found by bisection over the cell's distinct pair sums
+    v_i + v_j, counting the averages at or below a pair sum with one
+    sorted-merge pass (a single searchsorted over all cells) per step.
+    Samples of all cells are done together, in blocks of at most
+    MAX_WALSH_BATCH counts. Returns the medians of all samples, cell by cell.
+    """
+    sizes = np.array([len(d) for d in distinct_sets])
+    width = sizes.max()
+
+    # Per cell: its distinct pair sums, and the rank of each v_i + v_j among them
+    # (increasing along j). Row i of cell c becomes block first_block[c] + i of
+    # one sorted key array, holding block * stride + rank for every j.
+    first_block = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    pair_sum_sets, rank_sets = [], []
+    diagonal_rank = np.full((len(sizes), width), np.iinfo(np.int64).max)
+    for c, distinct in enumerate(distinct_sets):
+        pair_sums, ranks = np.unique((distinct[:, None] + distinct[None, :]).ravel(), return_inverse=True)
+        ranks = ranks.reshape(len(distinct), len(distinct))
+        pair_sum_sets.append(pair_sums)
+        rank_sets.append(ranks)
+        diagonal_rank[c, :len(distinct)] = np.diagonal(ranks)
+    n_pair_sums = np.array([len(p) for p in pair_sum_sets])
+    pair_sums = pad_cells(pair_sum_sets)
+    stride = n_pair_sums.max() + 1
+    keys = np.concatenate([((first_block[c] + np.arange(len(ranks)))[:, None] * stride + ranks).ravel()
+                           for c, ranks in enumerate(rank_sets)])
+    key_start = np.concatenate([[0], np.cumsum(np.repeat(sizes, sizes))[:-1]])
+
+    cell_of_row = np.repeat(np.arange(len(sizes)), [len(counts) for counts in count_sets])
+    counts = np.zeros((len(cell_of_row), width), dtype=np.int32)
+    start = 0
+    for counts_c in count_sets:
+        counts[start:start + len(counts_c), :counts_c.shape[1]] = counts_c
+        start += len(counts_c)
+    n = counts.sum(axis=1, dtype=np.int64)
+    n_walsh = n * (n + 1) // 2
+
+    # Rows go in order of width, so each block is only as wide as its last row
+    row_width = sizes[cell_of_row]
+    order = np.argsort(row_width, kind='stable')
+    medians = np.empty(len(cell_of_row))
+    start = 0
+    while start < len(order):
+        stop = min(len(order), start + max(1, MAX_WALSH_BATCH // row_width[order[start]]))
+        stop = min(stop, start + max(1, MAX_WALSH_BATCH // row_width[order[stop - 1]]))
+        rows = order[start:stop]
+        cell, block_width = cell_of_row[rows], row_width[rows[-1]]
+        block_counts = counts[rows, :block_width].astype(np.int64)
+        at_most = np.concatenate([np.zeros((len(rows), 1), dtype=np.int64), np.cumsum(block_counts, axis=1)], axis=1)
+        # Padding columns have zero counts, so they may point at any valid block
+        block = first_block[cell][:, None] + np.minimum(np.arange(block_width), sizes[cell][:, None] - 1)
+        block_keys, block_starts = block * stride, key_start[block]
+        diagonal = diagonal_rank[cell, :block_width]
+
+        # Invariant: fewer than k averages at or below pair sum rank `low`, at least k
+        # (`at_high` of them) at rank `high`
+        top = n_pair_sums[cell] - 1
+        low, high, at_high = np.full(len(rows), -1), top, n_walsh[rows]
+        middle = []
+        for k in ((n_walsh[rows] + 1) // 2, (n_walsh[rows] + 2) // 2):
+            # The upper middle average is the lower one's pair sum unless fewer than k averages reach it
+            further = at_high < k
+            low, high = np.where(further, high, low), np.where(further, top, high)
+            at_high = np.where(further, n_walsh[rows], at_high)
+            while np.any(high - low > 1):
+                mid = (low + high) // 2
+                partners = np.searchsorted(keys, block_keys + mid[:, None], side='right') - block_starts
+                ordered_pairs = (block_counts * np.take_along_axis(at_most, partners, axis=1)).sum(axis=1)
+                same_value_pairs = (block_counts * (diagonal <= mid[:, None])).sum(axis=1)
+                walsh_at_most = (ordered_pairs + same_value_pairs) // 2
+                enough = walsh_at_most >= k
+                low, high = np.where(enough, low, mid), np.where(enough, mid, high)
+                at_high = np.where(enough, walsh_at_most, at_high)
+            middle.append(pair_sums[cell, high] / 2)
+        medians[rows] = (middle[0] + middle[1]) / 2
+        start = stop
+    return medians
+
+def signed_rank_critical_k(n, confidence):
+    """Order statistic k so that [W_(k), W_(M+1-k)] is a `confidence` CI for the shift."""
+    alpha = 1 - confidence
+    if n <= MAX_EXACT_N:
+        # Exact null distribution of the signed-rank statistic T+ by convolution
+        counts = np.array([1.0])
+        for i in range(1, n + 1):
+            shifted = np.zeros(len(counts) + i)
+            shifted[:len(counts)] += counts
+            shifted[i:] += counts
+            counts = shifted
+        cdf = np.cumsum(counts) / counts.sum()
+        below = np.flatnonzero(cdf <= alpha / 2)
+        return int(below[-1]) + 1 if len(below) else 1
+    n_walsh = n * (n + 1) / 2
+    z = stats.norm.ppf(1 - alpha / 2)
+    return max(1, int(np.floor(n_walsh / 2 - z * np.sqrt(n * (n + 1) * (2 * n + 1) / 24))))
+
+def hodges_lehmann(differences, confidence=0.95, method='exact', n_boot=2000,
+                   root_seed=random_streams.DEFAULT_ROOT_SEED, stream_key=None):
+    """Hodges-Lehmann shift (median Walsh average) of paired differences with a CI.
+
+    method='exact' uses the distribution-free signed-rank interval (exact
+    null for n <= MAX_EXACT_N, normal approximation above). method='bootstrap'
+    gives a percentile interval from `n_boot` resamples drawn from the
+    random stream named by stream_key = (analysis, survey, arm, follow_up).
+    Returns (estimate, low, high).
+    """
+    values = np.sort(np.asarray(differences, dtype=float))
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return np.nan, np.nan, np.nan
+
+    if method == 'bootstrap':
+        estimates, lows, highs = hodges_lehmann_cells([values], confidence, method, n_boot, root_seed, [stream_key])
+        return float(estimates[0]), float(lows[0]), float(highs[0])
+
+    n_walsh = n * (n + 1) // 2
+    estimate = walsh_median(values)
+    k = signed_rank_critical_k(n, confidence)
+    return estimate, kth_walsh_average(values, k), kth_walsh_average(values, n_walsh + 1 - k)
+
+def hodges_lehmann_cells(cells, confidence=0.95, method='exact', n_boot=2000,
+                         root_seed=random_streams.DEFAULT_ROOT_SEED, stream_keys=None):
+    """hodges_lehmann() for a list of difference arrays; returns (estimates, lows, highs).
+
+    With method='exact', all cells of up to MAX_MATERIALIZED_N values are
+    done together: the Walsh averages of the NaN-padded (cells x n) matrix
+    are sorted row-wise and every row's median and CI order statistics are
+    picked at once, in batches of at most MAX_WALSH_BATCH averages; larger
+    cells go through hodges_lehmann() one at a time. With
+    method='bootstrap', each cell's resamples come from its own random
+    stream (from `stream_keys`), and the Walsh medians of every cell and
+    resample are found together by walsh_medians_from_counts().
+    """
+    cells = [np.sort(drop_nan(c)) for c in cells]
+    estimates, lows, highs = (np.full(len(cells), np.nan) for _ in range(3))
+    sizes = np.array([len(c) for c in cells], dtype=int)
+
+    if method == 'bootstrap':
+        index = np.flatnonzero(sizes > 0)
+        if len(index) == 0:
+            return estimates, lows, highs
+        medians = np.empty((len(index), n_boot + 1))
+        group, distinct_sets, count_sets = [], [], []
+        for position, i in enumerate(index):
+            key = stream_keys[i] if stream_keys is not None else None
+            distinct, counts = np.unique(cells[i], return_counts=True)
+            group.append(position)
+            distinct_sets.append(distinct)
+            # The first row is the cell itself, for the estimate
+            count_sets.append(np.vstack([counts, bootstrap_counts(cells[i], n_boot, root_seed, key)]))
+            # Cells go together while their pair sum tables (distinct values squared) fit in MAX_WALSH_BATCH
+            if sum(len(d) ** 2 for d in distinct_sets) >= MAX_WALSH_BATCH or position == len(index) - 1:
+                medians[group] = walsh_medians_from_counts(distinct_sets, count_sets).reshape(len(group), n_boot + 1)
+                group, distinct_sets, count_sets = [], [], []
+        alpha = 1 - confidence
+        estimates[index] = medians[:, 0]
+        lows[index], highs[index] = np.quantile(medians[:, 1:], [alpha / 2, 1 - alpha / 2], axis=1)
+        return estimates, lows, highs
+
+    vectorized = (sizes > 0) & (sizes <= MAX_MATERIALIZED_N)
+    for i in np.flatnonzero(~vectorized & (sizes > 0)):
+        estimates[i], lows[i], highs[i] = hodges_lehmann(cells[i], confidence, method)
+
+    index = np.flatnonzero(vectorized)
+    if len(index) == 0:
+        return estimates, lows, highs
+    width = sizes[index].max()
+    rows, cols = np.triu_indices(width)
+    batch = max(1, MAX_WALSH_BATCH // len(rows))
+    critical_k = {n: signed_rank_critical_k(n, confidence) for n in np.unique(sizes[index])}
+    for start in range(0, len(index), batch):
+        block = index[start:start + batch]
+        padded = pad_cells([cells[i] for i in block])
+        padded = np.pad(padded, ((0, 0), (0, width - padded.shape[1])), constant_values=np.nan)
+        # Pairs involving padding are NaN and sort to the end of each row
+        walsh = np.sort((padded[:, rows] + padded[:, cols]) / 2, axis=1)
+
+        n = sizes[block]
+        n_walsh = n * (n + 1) // 2
+        k = np.array([critical_k[m] for m in n])
+        picks = np.column_stack([(n_walsh + 1) // 2, (n_walsh + 2) // 2, k, n_walsh + 1 - k]) - 1
+        values = np.take_along_axis(walsh, picks, axis=1)
+        estimates[block] = (values[:, 0] + values[:, 1]) / 2
+        lows[block], highs[block] = values[:, 2], values[:, 3]
+    return estimates, lows, highs
+
+def cliffs_delta_cells(x_cells, y_cells):
+    """Cliff's delta, P(X > Y) - P(X < Y), for many (x, y) cells at once by sorted-merge counting.
+
+    Values are replaced by their global ranks and offset by cell, so one
+    sort of all y values and one binary search of all x values count the
+    smaller and larger y for every x, within its own cell only. This is
+    O(N log N) in the total number of values instead of comparing all pairs.
+    """
+    x_cells = [drop_nan(x) for x in x_cells]
+    y_cells = [drop_nan(y) for y in y_cells]
+    n_x = np.array([len(x) for x in x_cells], dtype=int)
+    n_y = np.array([len(y) for y in y_cells], dtype=int)
+    if n_x.sum() == 0 or n_y.sum() == 0:
+        return np.full(len(x_cells), np.nan)
+
+    # Integer ranks keep ties exact; the offset keeps each cell's values apart
+    values = np.concatenate(x_cells + y_cells)
+    _, ranks = np.unique(values, return_inverse=True)
+    offset = len(values) + 1
+    x_keys = np.repeat(np.arange(len(x_cells)), n_x) * offset + ranks[:n_x.sum()]
+    y_keys = np.sort(np.repeat(np.arange(len(y_cells)), n_y) * offset + ranks[n_x.sum():])
+
+    y_start = np.concatenate([[0], np.cumsum(n_y)[:-1]])
+    x_cell = np.repeat(np.arange(len(x_cells)), n_x)
+    less = np.searchsorted(y_keys, x_keys, side='left') - y_start[x_cell]                   # y values below each x
+    greater = y_start[x_cell] + n_y[x_cell] - np.searchsorted(y_keys, x_keys, side='right')  # y values above each x
+    dominance = np.bincount(x_cell, weights=less - greater, minlength=len(x_cells))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where((n_x > 0) & (n_y > 0), dominance / (n_x * n_y), np.nan)
+
+def cliffs_delta(x, y):
+    """Cliff's delta of a single pair of samples (see cliffs_delta_cells)."""
+    return float(cliffs_delta_cells([x], [y])[0])
@@ -1,36 +1,14 @@
 import pandas as pd
 import numpy as np
 import os
-
-# Load the dataset
-try:
-    df = pd.read_csv('data/ibs-all-patients-flat-scores.csv')
-except FileNotFoundError:
-    print("Error: 'data/ibs-all-patients-flat-scores.csv' not found. Make sure the file is in the 'data' directory.")
-    exit()
-
-# Data Cleaning and Preparation
-# Convert 'score' to numeric, coercing errors to NaN
-df['score'] = pd.to_numeric(df['score'], errors='coerce')
-
-# Drop rows where 'score' is NaN after conversion
-df.dropna(subset=['score'], inplace=True)
-
-# Ensure 'follow_up_number' and 'patient_number' are of appropriate types
-df['follow_up_number'] = pd.to_numeric(df['follow_up_number'], errors='coerce')
-df.dropna(subset=['follow_up_number'], inplace=True)
-df['patient_number'] = df['patient_number'].astype(str)
-df['patient_fmt_or_p'] = df['patient_fmt_or_p'].astype(str).str.upper()
-
-# Create results directory if it doesn't exist
-os.makedirs('results', exist_ok=True)
+import ibs_data
 
 # Function to format mean and std as "mean±std"
 def format_mean_std(mean, std):
     return f"{mean:.1f}±{std:.1f}"
 
-# Process each survey
-for survey_name in sorted(df['survey_name'].unique()):
+def build_summary_table(df, survey_name):
+    """Mean±SD of total and category scores per follow-up and group for one survey."""
     survey_df = df[df['survey_name'] == survey_name].copy()
     
     # Get unique categories for this survey
@@ -48,7 +26,7 @@ for survey_name in sorted(df['survey_name'].unique()):
             treatment_df = follow_up_df[follow_up_df['patient_fmt_or_p'] == treatment]
             
             # Calculate total scores per patient
-            patient_totals = treatment_df.groupby('patient_number')['score'].sum()
+            patient_totals = treatment_df.groupby('patient_number', observed=True)['score'].sum()
             
             # Calculate mean and std for total scores
             total_mean = patient_totals.mean()
@@ -67,7 +45,7 @@ for survey_name in sorted(df['survey_name'].unique()):
             
             # Calculate mean and std for each category
             for category in categories:
-                category_scores = treatment_df[treatment_df['q_category'] == category].groupby('patient_number')['score'].sum()
+                category_scores = treatment_df[treatment_df['q_category'] == category].groupby('patient_number', observed=True)['score'].sum()
                 cat_mean = category_scores.mean()
                 cat_std = category_scores.std()
                 row[category] = format_mean_std(cat_mean, cat_std)
@@ -79,10 +57,11 @@ for survey_name in sorted(df['survey_name'].unique()):
     
     # Reorder columns to put Total Score after N
     cols = ['Follow-up', 'Group', 'N', 'Total Score'] + categories
-    table_df = table_df[cols]
-    
-    # Create styled table
-    styled_table = table_df.style.set_properties(**{
+    return table_df[cols]
+
+def style_table(table_df):
+    """Apply the bordered, striped style shared by all HTML tables."""
+    return table_df.style.set_properties(**{
         'text-align': 'center',
         'padding': '5px',
         'border': '1px solid black'
@@ -98,13 +77,27 @@ for survey_name in sorted(df['survey_name'].unique()):
         {'selector': 'tr:nth-of-type(odd)',
          'props': [('background-color', '#f9f9f9')]}
     ])
-    
-    # Save as HTML
-    output_file = f"results/{survey_name}_summary_table.html"
-    with open(output_file, 'w') as f:
-        f.write(f"<h2>{survey_name} Summary Table</h2>")
-        f.write(styled_table.to_html())
-    
-    print(f"Generated summary table for {survey_name}")
 
-print("\nAll summary tables have been generated in the 'results' directory.") 
\ No newline at end of file
+if __name__ == '__main__':
+    args = ibs_data.parse_source_args()
+    df = ibs_data.load_data(args.source)
+
+    # Create results directory if it doesn't exist
+    os.makedirs('results', exist_ok=True)
+
+    # Process each survey
+    for survey_name in sorted(df['survey_name'].unique()):
+        table_df = build_summary_table(df, survey_name)
+        
+        # Create styled table
+        styled_table = style_table(table_df)
+        
+        # Save as HTML
+        output_file = f"results/{survey_name}_summary_table.html"
+        with open(output_file, 'w') as f:
+            f.write(f"<h2>{survey_name} Summary Table</h2>")
+            f.write(styled_table.to_html())
+        
+        print(f"Generated summary table for {survey_name}")
+
+    print("\nAll summary tables have been generated in the 'results' directory.")
@@ -0,0 +1,138 @@
+import pandas as pd
+import argparse
+import os
+
+DATA_FILE = 'data/ibs-all-patients-flat-scores.csv'
+QUESTIONS_FILE = 'data/all-survey-questions'
+PATIENTS_FILE = 'data/patient-fmt-or-placebo'
+PARQUET_DIR = 'data/parquet'
+
+# Columns that actually vary per row of the flat file
+FACT_COLUMNS = ['patient_number', 'follow_up_number', 'q_id', 'score']
+
+SOURCES = ['flat', 'normalised', 'parquet']
+
+def clean_scores(df):
+    """Data cleaning shared by every script: drop rows without a numeric score or session."""
+    df['score'] = pd.to_numeric(df['score'], errors='coerce')
+    df.dropna(subset=['score'], inplace=True)
+    df['follow_up_number'] = pd.to_numeric(df['follow_up_number'], errors='coerce')
+    df.dropna(subset=['follow_up_number'], inplace=True)
+    return df
+
+def read_flat(file=DATA_FILE):
+    """Read every column of the flat file, as the scripts always have.
+
+    `file` may also be a buffer holding part of the file (with its header).
+    """
+    df = pd.read_csv(file)
+    df = clean_scores(df)
+    df['patient_number'] = df['patient_number'].astype(str)
+    df['patient_fmt_or_p'] = df['patient_fmt_or_p'].astype(str).str.upper()
+    return df
+
+def categorical_lookup(values, codes):
+    """Categorical column taking values[codes], without building one string per row."""
+    lookup = pd.Categorical(values)
+    row_codes = lookup.codes[codes]
+    # Rows whose key is missing from the dimension table stay missing
+    row_codes[codes < 0] = -1
+    return pd.Categorical.from_codes(row_codes, categories=lookup.categories)
+
+def read_normalised():
+    """Read only the fact columns and join the reference files by integer key.
+
+    `all-survey-questions` (q_id, survey_name, q_number, q_category) and
+    `patient-fmt-or-placebo` (patient_number, patient_fmt_or_p) are the
+    source of truth for question and treatment metadata. Repeated strings
+    are held as categoricals, so each distinct value is stored once. The
+    free-text `answer` column is not loaded.
+    """
+    facts = pd.read_csv(DATA_FILE, usecols=FACT_COLUMNS, dtype={'patient_number': 'category'})
+    facts = clean_scores(facts)
+
+    questions = pd.read_csv(QUESTIONS_FILE).drop_duplicates('q_id').set_index('q_id')
+    patients = pd.read_csv(PATIENTS_FILE).rename(columns={'patient_fmt_or_placebo': 'patient_fmt_or_p'})
+    patients['patient_number'] = patients['patient_number'].astype(str)
+    patients = patients.drop_duplicates('patient_number').set_index('patient_number')
+
+    # Integer position of each row's question and patient in the dimension tables
+    question_codes = questions.index.get_indexer(facts['q_id'])
+    unknown = question_codes < 0
+    if unknown.any():
+        print(f"Warning: dropping {unknown.sum()} rows whose q_id is not in '{QUESTIONS_FILE}'.")
+        facts = facts[~unknown]
+        question_codes = question_codes[~unknown]
+
+    patient_categories = facts['patient_number'].cat.categories.astype(str)
+    patient_arms = patients['patient_fmt_or_p'].reindex(patient_categories).astype(str).str.upper()
+    patient_codes = facts['patient_number'].cat.codes.to_numpy()
+
+    df = pd.DataFrame({
+        'survey_name': categorical_lookup(questions['survey_name'].to_numpy(), question_codes),
+        'q_number': questions['q_number'].to_numpy()[question_codes],
+        'q_id': facts['q_id'].to_numpy(),
+        'q_category': categorical_lookup(questions['q_category'].astype(str).to_numpy(), question_codes),
+        'patient_number': pd.Categorical.from_codes(patient_codes, categories=patient_categories),
+        'patient_fmt_or_p': categorical_lookup(patient_arms.to_numpy(), patient_codes),
+        'follow_up_number': facts['follow_up_number'].to_numpy(),
+        'score': facts['score'].to_numpy(),
+    }, index=facts.index)
+    return df
+
+def read_parquet():
+    """Read the analysis columns of the Parquet export (see parquet_store.py); no CSV parsing.
+
+    The export is already cleaned, so the rows are used as stored.
+    """
+    # Imported here so the CSV sources do not need pyarrow
+    import parquet_store
+    if not os.path.isdir(os.path.join(PARQUET_DIR, 'scores')):
+        raise FileNotFoundError(2, 'No such directory', os.path.join(PARQUET_DIR, 'scores'))
+    df = parquet_store.read_scores(columns=parquet_store.ANALYSIS_COLUMNS)
+    df['follow_up_number'] = df['follow_up_number'].astype(int)
+    return df
+
+def source_files(source='flat'):
+    """Input files read by load_data() for a source."""
+    if source == 'normalised':
+        return [DATA_FILE, QUESTIONS_FILE, PATIENTS_FILE]
+    if source == 'parquet':
+        import parquet_store
+        return parquet_store.dataset_files()
+    return [DATA_FILE]
+
+def load_data(source='flat'):
+    """Load and clean the scores from the chosen source.
+
+    'flat' parses every column of the flat file; 'normalised' reads only the
+    fact columns and takes question and treatment metadata from the
+    reference files (see read_normalised); 'parquet' reads the cleaned
+    export written by parquet_store.py (see read_parquet).
+    """
+    try:
+        if source == 'normalised':
+            return read_normalised()
+        if source == 'parquet':
+            return read_parquet()
+        return read_flat()
+    except FileNotFoundError as error:
+        hint = " Run parquet_store.py to create the Parquet export." if source == 'parquet' else ""
+        print(f"Error: '{error.filename}' not found. Make sure the file is in the 'data' directory.{hint}")
+        exit()
+
+def add_source_argument(parser):
+    """Add the --source option shared by all scripts."""
+    parser.add_argument('--source', choices=SOURCES, default='flat',
+                        help="Where to load the scores from (default: flat CSV with every column)")
+    return parser
+
+def parse_source_args(description=None):
+    """Parse just --source for scripts that take no other options.
+
+    Unknown arguments are ignored, so scripts also run under other
+    entry points (e.g. build_report.py) without failing.
+    """
+    parser = add_source_argument(argparse.ArgumentParser(description=description))
+    args, _ = parser.parse_known_args()
+    return args
@@ -0,0 +1,213 @@
+import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import seaborn as sns
+import os
+import ibs_data
+
+def item_matrix(session_df):
+    """Patient x item score array for one (survey, session), complete cases only.
+
+    Returns the array, the q_ids of its columns and the category of each
+    column. Patients missing any item are dropped, as Cronbach's alpha and
+    the correlations below need a complete matrix.
+    """
+    wide = session_df.pivot_table(index='patient_number', columns='q_id', values='score', aggfunc='first', observed=True)
+    wide = wide.dropna()
+    categories = session_df.drop_duplicates('q_id').set_index('q_id')['q_category'].reindex(wide.columns)
+    return wide.to_numpy(dtype=float), wide.columns.to_numpy(), categories.astype(str).to_numpy()
+
+def cronbach_alpha(scores, membership):
+    """Cronbach's alpha for several item groups at once.
+
+    `scores` is patients x items and `membership` is an items x groups 0/1
+    matrix, so one call gives alpha for the whole survey and every category.
+    """
+    item_var = scores.var(axis=0, ddof=1)
+    group_totals = scores @ membership
+    total_var = group_totals.var(axis=0, ddof=1)
+    n_items = membership.sum(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alpha = n_items / (n_items - 1) * (1 - (item_var @ membership) / total_var)
+    # Alpha is undefined for a single item or a constant total
+    alpha[(n_items < 2) | ~(total_var > 0)] = np.nan
+    return alpha
+
+def item_total_correlations(scores):
+    """Corrected item-total correlation of every item (item vs total of the others)."""
+    cov = np.cov(scores, rowvar=False)
+    item_var = np.diag(cov)
+    cov_with_total = cov.sum(axis=1)
+    total_var = cov.sum()
+
+    # cov(x_i, T - x_i) and var(T - x_i) from the covariance matrix alone
+    cov_rest = cov_with_total - item_var
+    rest_var = total_var - 2 * cov_with_total + item_var
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return cov_rest / np.sqrt(item_var * rest_var)
+
+def inter_item_correlations(scores):
+    """Pearson correlation matrix between items (NaN for constant items)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.corrcoef(scores, rowvar=False)
+
+def response_distributions(df):
+    """Share of patients giving each score, per survey, session, arm and item."""
+    counts = df.groupby(['survey_name', 'follow_up_number', 'patient_fmt_or_p', 'q_id', 'score'], observed=True).size()
+    shares = counts / counts.groupby(level=['survey_name', 'follow_up_number', 'patient_fmt_or_p', 'q_id'], observed=True).transform('sum')
+    distributions = pd.DataFrame({'Count': counts, 'Proportion': shares.round(3)}).reset_index()
+    return distributions.rename(columns={
+        'survey_name': 'Survey',
+        'follow_up_number': 'Follow-up',
+        'patient_fmt_or_p': 'Treatment',
+        'q_id': 'Question ID',
+        'score': 'Score',
+    })
+
+def analyse_session(session_df, survey_name, follow_up):
+    """Reliability rows, item rows and correlation matrix for one (survey, session)."""
+    scores, q_ids, categories = item_matrix(session_df)
+    n_patients, n_items = scores.shape
+    if n_patients < 3 or n_items < 2:
+        return [], [], None
+
+    # Membership matrix: one column for the whole survey, then one per category
+    category_names = sorted(set(categories))
+    membership = np.column_stack(
+        [np.ones(n_items)] + [(categories == name).astype(float) for name in category_names]
+    )
+    alphas = cronbach_alpha(scores, membership)
+
+    reliability_rows = [
+        {
+            'Survey': survey_name,
+            'Follow-up': follow_up,
+            'Scale': scale,
+            'N': n_patients,
+            'Items': int(k),
+            "Cronbach's Alpha": alpha,
+        }
+        for scale, k, alpha in zip(['Total'] + category_names, membership.sum(axis=0), alphas)
+    ]
+
+    item_rows = pd.DataFrame({
+        'Survey': survey_name,
+        'Follow-up': follow_up,
+        'Question ID': q_ids,
+        'Category': categories,
+        'N': n_patients,
+        'Mean': scores.mean(axis=0),
+        'SD': scores.std(axis=0, ddof=1),
+        'Item-Total Correlation': item_total_correlations(scores),
+    }).to_dict('records')
+
+    correlations = pd.DataFrame(inter_item_correlations(scores), index=q_ids, columns=q_ids)
+    return reliability_rows, item_rows, correlations
+
+def arm_correlations(session_df):
+    """Inter-item correlation matrix per treatment arm for one (survey, session).
+
+    Arms with fewer than 3 complete patients are left out, as in analyse_session.
+    """
+    matrices = {}
+    for arm, arm_df in session_df.groupby('patient_fmt_or_p', observed=True):
+        scores, q_ids, _ = item_matrix(arm_df)
+        if scores.shape[0] >= 3 and scores.shape[1] >= 2:
+            matrices[arm] = pd.DataFrame(inter_item_correlations(scores), index=q_ids, columns=q_ids)
+    return matrices
+
+def plot_correlation_heatmaps(survey_name, matrices, output_file):
+    """Grid of inter-item correlation heatmaps: one row per group (all patients, then each arm), one column per session.
+
+    `matrices` maps (group, follow_up) to a correlation matrix.
+    """
+    groups = list(dict.fromkeys(group for group, _ in matrices))
+    sessions = sorted(set(follow_up for _, follow_up in matrices))
+    fig, axes = plt.subplots(nrows=len(groups), ncols=len(sessions),
+                             figsize=(5 * len(sessions), 5 * len(groups)), squeeze=False)
+    for row, group in enumerate(groups):
+        for col, follow_up in enumerate(sessions):
+            ax = axes[row][col]
+            if (group, follow_up) not in matrices:
+                ax.axis('off')
+                continue
+            sns.heatmap(matrices[(group, follow_up)], ax=ax, vmin=-1, vmax=1, cmap='RdBu_r', square=True,
+                        cbar=(col == len(sessions) - 1), xticklabels=False, yticklabels=False)
+            ax.set_title(f'{group}, follow-up {follow_up}')
+    fig.suptitle(f'Inter-item Correlations for {survey_name}', fontsize=14)
+    plt.tight_layout(rect=[0, 0, 1, 0.95])
+    plt.savefig(output_file)
+    plt.close(fig)
+
+if __name__ == '__main__':
+    args = ibs_data.parse_source_args()
+    df = ibs_data.load_data(args.source)
+
+    # Create results directory if it doesn't exist
+    os.makedirs('results', exist_ok=True)
+
+    all_reliability = []
+    all_items = []
+
+    # Process each survey and session; everything per item is array maths
+    for survey_name in sorted(df['survey_name'].unique()):
+        survey_df = df[df['survey_name'] == survey_name]
+        matrices = {}
+
+        for follow_up, session_df in survey_df.groupby('follow_up_number'):
+            reliability_rows, item_rows, correlations = analyse_session(session_df, survey_name, follow_up)
+            all_reliability.extend(reliability_rows)
+            all_items.extend(item_rows)
+            if correlations is not None:
+                matrices[('All', follow_up)] = correlations
+                correlations.to_csv(f"results/item_correlations_{survey_name}_fu{follow_up}.csv")
+
+            # The same matrices split by treatment arm
+            for arm, arm_matrix in arm_correlations(session_df).items():
+                matrices[(arm, follow_up)] = arm_matrix
+                arm_matrix.to_csv(f"results/item_correlations_{survey_name}_fu{follow_up}_{arm}.csv")
+
+        if matrices:
+            plot_correlation_heatmaps(survey_name, matrices, f"results/item_correlations_{survey_name}.png")
+        print(f"Generated item analysis for {survey_name}")
+
+    reliability_df = pd.DataFrame(all_reliability)
+    items_df = pd.DataFrame(all_items)
+    distributions_df = response_distributions(df)
+
+    reliability_df.to_csv("results/item_reliability.csv", index=False)
+    items_df.to_csv("results/item_statistics.csv", index=False)
+    distributions_df.to_csv("results/item_response_distributions.csv", index=False)
+
+    # Create styled table
+    styled_table = reliability_df.round(3).style.set_properties(**{
+        'text-align': 'center',
+        'padding': '5px',
+        'border': '1px solid black'
+    }).set_table_styles([
+        {'selector': 'th',
+         'props': [('background-color', '#f0f0f0'),
+                  ('text-align', 'center'),
+                  ('padding', '5px'),
+                  ('border', '1px solid black'),
+                  ('font-weight', 'bold')]},
+        {'selector': 'td',
+         'props': [('border', '1px solid black')]},
+        {'selector': 'tr:nth-of-type(odd)',
+         'props': [('background-color', '#f9f9f9')]}
+    ])
+
+    output_file = "results/item_reliability.html"
+    with open(output_file, 'w') as f:
+        f.write("<h2>Internal Consistency (Cronbach's Alpha)</h2>")
+        f.write("<p>Complete cases only, per survey, session and question category.</p>")
+        f.write(styled_table.to_html())
+
+    print(f"\nItem analysis results have been saved to:")
+    print(f"1. Reliability table: {output_file}")
+    print(f"2. CSV files: results/item_reliability.csv, results/item_statistics.csv, results/item_response_distributions.csv")
+    print(f"3. Correlation matrices: results/item_correlations_<survey>_fu<session>[_<arm>].csv")
+    print(f"4. Heatmaps (all patients and per arm): results/item_correlations_<survey>.png")
@@ -0,0 +1,500 @@
+import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import argparse
+import csv
+import html
+import io
+import json
+import os
+import threading
+import time
+import webbrowser
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+
+import ibs_data
+from generate_summary_tables import format_mean_std
+from perform_wilcoxon_tests import perform_wilcoxon_test
+
+# Create mapping from follow-up number to months
+follow_up_to_months = {
+    0: 0,   # baseline
+    1: 1,   # 1 month
+    2: 3,   # 3 months
+    3: 6,   # 6 months
+    4: 12   # 12 months
+}
+
+# Define colors for treatments
+color_mapping = {'FMT': 'green', 'PLACEBO': 'orange'}
+
+TREATMENTS = ['FMT', 'PLACEBO']
+
+# Seconds an unterminated last line must stay unchanged before it is taken as a finished row
+UNTERMINATED_QUIET_SECONDS = 2.0
+
+@dataclass
+class RunningStats:
+    """Count, mean and variance of a set of values, updated one value at a time (Welford).
+
+    Values can also be removed, so a patient's total can be replaced when
+    more of their answers for a session arrive.
+    """
+    n: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.n -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.n
+        self.m2 -= delta * (value - self.mean)
+
+    def replace(self, old, new):
+        """Swap one value for another (old=None adds a new value)."""
+        if old is not None:
+            self.remove(old)
+        self.add(new)
+
+    @property
+    def mean_or_nan(self):
+        return self.mean if self.n else np.nan
+
+    @property
+    def std(self):
+        """Sample standard deviation (ddof=1), as pandas reports it."""
+        return np.sqrt(max(self.m2, 0.0) / (self.n - 1)) if self.n > 1 else np.nan
+
+class FileTail:
+    """Reads the lines appended to a CSV since the last call.
+
+    Complete lines are returned straight away. A last line without a
+    newline is normally still being written, so it waits. Spreadsheet
+    exports often end without a newline, so the line is taken as the final
+    row once it has every column and the file has not changed for
+    UNTERMINATED_QUIET_SECONDS. If anything is written after a line taken
+    that way (it may have been cut short), or the file is replaced or
+    truncated, reading starts again from the top and `reset` is set on
+    the result.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.start_over(None)
+
+    def start_over(self, inode):
+        self.header = None
+        self.offset = 0
+        self.inode = inode
+        self.unterminated = None          # (file size, time) when an unterminated last line was first seen
+        self.took_unterminated = False    # the last line read had no newline
+
+    def is_full_row(self, line):
+        """True if an unterminated line has as many fields as the header."""
+        if self.header is None:
+            return True
+        text = line.decode('utf-8', errors='replace')
+        header = self.header.decode('utf-8', errors='replace').rstrip('\r\n')
+        return len(next(csv.reader([text]))) == len(next(csv.reader([header])))
+
+    def read_new(self):
+        """(reset, CSV text with header) of new complete lines, or (reset, None)."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False, None
+
+        reset = False
+        changed_after_unterminated = self.took_unterminated and stat.st_size != self.offset
+        if stat.st_ino != self.inode or stat.st_size < self.offset or changed_after_unterminated:
+            reset = self.inode is not None
+            self.start_over(stat.st_ino)
+        if stat.st_size == self.offset:
+            return reset, None
+
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(stat.st_size - self.offset)
+        end = chunk.rfind(b'\n') + 1
+        if end == len(chunk):
+            self.unterminated = None
+        elif (self.unterminated and self.unterminated[0] == stat.st_size
+              and time.monotonic() - self.unterminated[1] >= UNTERMINATED_QUIET_SECONDS
+              and self.is_full_row(chunk[end:])):
+            # Quiet for long enough and complete: the writer has finished, so take the line as it is
+            self.unterminated = None
+            self.took_unterminated = True
+            end = len(chunk)
+            chunk += b'\n'
+        else:
+            # Probably still being written; wait for a later poll
+            if not self.unterminated or self.unterminated[0] != stat.st_size:
+                self.unterminated = (stat.st_size, time.monotonic())
+            chunk = chunk[:end]
+        if end == 0:
+            return reset, None
+        self.offset += end
+
+        if self.header is None:
+            header_end = chunk.index(b'\n') + 1
+            self.header, chunk = chunk[:header_end], chunk[header_end:]
+        return reset, (self.header + chunk) if chunk else None
+
+class Dashboard:
+    """Running per-patient totals and per-cell statistics behind the dashboard.
+
+    Patient totals are kept per (survey, category, treatment, follow-up),
+    with category None for the survey total, and each of those cells keeps
+    Welford running statistics of its patient totals. New rows only touch
+    the cells they belong to, and only those table cells, Wilcoxon tests
+    and plot panels are recomputed. Every change gets a version number so
+    the browser can ask for just what changed since its last poll.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.reset()
+
+    def reset(self):
+        # The browser reloads the page when the generation changes
+        self.generation += 1
+        self.totals = {}        # (survey, category, treatment, follow-up) -> {patient: total}
+        self.stats = {}         # same key -> RunningStats of the patient totals
+        self.categories = {}    # survey -> set of categories
+        self.sessions = {}      # survey -> set of follow-ups
+        self.version = 0
+        self.cells = {}         # cell id -> (version, text)
+        self.layouts = {}       # survey -> version its table layout last changed
+        self.panels = {}        # survey -> version its plot data last changed
+        self.panel_cache = {}   # survey -> (version, png bytes)
+        self.rows_applied = 0
+
+    def apply_rows(self, rows):
+        """Fold newly appended (cleaned) rows into the running totals."""
+        if rows.empty:
+            return
+        rows = rows.assign(follow_up_number=rows['follow_up_number'].astype(int))
+        keys = ['survey_name', 'patient_fmt_or_p', 'follow_up_number', 'patient_number']
+        increments = pd.concat([
+            rows.groupby(keys)['score'].sum().reset_index().assign(q_category=None),
+            rows.groupby(keys + ['q_category'])['score'].sum().reset_index(),
+        ])
+
+        with self.lock:
+            self.version += 1
+            touched = set()
+            layout_changed = set()
+            for survey, treatment, follow_up, patient, score, category in increments[
+                    keys + ['score', 'q_category']].itertuples(index=False):
+                if pd.isna(category):
+                    category = None
+                elif category not in self.categories.setdefault(survey, set()):
+                    self.categories[survey].add(category)
+                    layout_changed.add(survey)
+                if follow_up not in self.sessions.setdefault(survey, set()):
+                    self.sessions[survey].add(follow_up)
+                    layout_changed.add(survey)
+
+                key = (survey, category, treatment, follow_up)
+                patient_totals = self.totals.setdefault(key, {})
+                old = patient_totals.get(patient)
+                new = (old or 0) + score
+                patient_totals[patient] = new
+                self.stats.setdefault(key, RunningStats()).replace(old, new)
+                touched.add(key)
+
+            for survey in layout_changed:
+                self.layouts[survey] = self.version
+            for survey, category, treatment, follow_up in touched:
+                self.panels[survey] = self.version
+                column = 'Total Score' if category is None else category
+                self.set_cell(summary_cell_id(survey, follow_up, treatment, column),
+                              self.summary_text(survey, category, treatment, follow_up))
+                if category is None:
+                    self.set_cell(summary_cell_id(survey, follow_up, treatment, 'N'),
+                                  str(self.stats[(survey, None, treatment, follow_up)].n))
+                    # A new baseline total changes every test of that group
+                    follow_ups = self.sessions[survey] if follow_up == 0 else [follow_up]
+                    for compared in follow_ups:
+                        if compared != 0:
+                            self.update_test(survey, treatment, compared)
+            self.rows_applied += len(rows)
+
+    def set_cell(self, cell_id, text):
+        """Record a cell's text, bumping its version only if it changed."""
+        if self.cells.get(cell_id, (None, None))[1] != text:
+            self.cells[cell_id] = (self.version, text)
+
+    def summary_text(self, survey, category, treatment, follow_up):
+        stats = self.stats.get((survey, category, treatment, follow_up), RunningStats())
+        # Rounding off the last few bits of incremental-update drift keeps
+        # the printed values identical to generate_summary_tables.py
+        return format_mean_std(round(stats.mean_or_nan, 9), round(stats.std, 9))
+
+    def update_test(self, survey, treatment, follow_up):
+        """Recompute one Wilcoxon test from the patients with both sessions."""
+        baseline_totals = self.totals.get((survey, None, treatment, 0), {})
+        follow_up_totals = self.totals.get((survey, None, treatment, follow_up), {})
+        patients = sorted(set(baseline_totals) & set(follow_up_totals))
+        baseline = np.array([baseline_totals[p] for p in patients], dtype=float)
+        follow_up_scores = np.array([follow_up_totals[p] for p in patients], dtype=float)
+
+        result = perform_wilcoxon_test(baseline, follow_up_scores)
+        change = f"{(follow_up_scores - baseline).mean():+.1f}" if patients else "---"
+        p_value = "---" if pd.isna(result['p_value']) else f"{result['p_value']:.3f}"
+        if result['significant']:
+            p_value += '*'
+        for column, text in [('N', str(len(patients))), ('Mean Change', change), ('p-value', p_value)]:
+            self.set_cell(test_cell_id(survey, treatment, follow_up, column), text)
+
+    def summary_layout(self, survey):
+        """Summary table rows and columns, in the order generate_summary_tables.py uses."""
+        columns = ['N', 'Total Score'] + sorted(self.categories.get(survey, ()))
+        rows = [(follow_up, treatment) for follow_up in sorted(self.sessions[survey]) for treatment in TREATMENTS]
+        return rows, columns
+
+    def table_html(self, survey):
+        """Summary and Wilcoxon tables of one survey, every cell addressable by id."""
+        rows, columns = self.summary_layout(survey)
+        # Cells of empty groups have never been computed
+        for follow_up, treatment in rows:
+            for column in columns:
+                cell_id = summary_cell_id(survey, follow_up, treatment, column)
+                if cell_id not in self.cells:
+                    category = None if column in ('N', 'Total Score') else column
+                    text = '0' if column == 'N' else self.summary_text(survey, category, treatment, follow_up)
+                    self.cells[cell_id] = (self.version, text)
+
+        parts = [f"<h3>Summary (mean±SD)</h3><table><tr><th>Follow-up</th><th>Group</th>"]
+        parts += [f"<th>{html.escape(column)}</th>" for column in columns]
+        parts.append("</tr>")
+        for follow_up, treatment in rows:
+            parts.append(f"<tr><td>{follow_up}</td><td>{treatment}</td>")
+            for column in columns:
+                cell_id = summary_cell_id(survey, follow_up, treatment, column)
+                parts.append(f"<td id=\"{html.escape(cell_id)}\">{html.escape(self.cells[cell_id][1])}</td>")
+            parts.append("</tr>")
+        parts.append("</table>")
+
+        test_columns = ['N', 'Mean Change', 'p-value']
+        parts.append("<h3>Wilcoxon signed rank test vs baseline</h3><table><tr><th>Treatment</th><th>Follow-up</th>")
+        parts += [f"<th>{column}</th>" for column in test_columns]
+        parts.append("</tr>")
+        for treatment in TREATMENTS:
+            for follow_up in sorted(self.sessions[survey] - {0}):
+                if test_cell_id(survey, treatment, follow_up, 'N') not in self.cells:
+                    self.update_test(survey, treatment, follow_up)
+                parts.append(f"<tr><td>{treatment}</td><td>{follow_up}</td>")
+                for column in test_columns:
+                    cell_id = test_cell_id(survey, treatment, follow_up, column)
+                    parts.append(f"<td id=\"{html.escape(cell_id)}\">{html.escape(self.cells[cell_id][1])}</td>")
+                parts.append("</tr>")
+        parts.append("</table>")
+        return "".join(parts)
+
+    def changes(self, since):
+        """Everything that changed after version `since`, as sent to the browser."""
+        with self.lock:
+            tables = {survey: self.table_html(survey) for survey in sorted(self.sessions)
+                      if self.layouts.get(survey, 0) > since}
+            return {
+                'generation': self.generation,
+                'version': self.version,
+                'rows': self.rows_applied,
+                'surveys': sorted(self.sessions),
+                'tables': tables,
+                'cells': {cell_id: text for cell_id, (version, text) in self.cells.items() if version > since},
+                'panels': {survey: version for survey, version in self.panels.items() if version > since},
+            }
+
+    def panel_png(self, survey):
+        """PNG of one survey's mean ±1 SD lines, re-rendered only when its data changed."""
+        with self.lock:
+            version = self.panels.get(survey)
+            cached = self.panel_cache.get(survey)
+            if version is None or (cached and cached[0] == version):
+                return cached[1] if cached else None
+            series = {}
+            for treatment in TREATMENTS:
+                points = [(follow_up_to_months.get(follow_up, follow_up), self.stats[key].mean_or_nan, self.stats[key].std)
+                          for follow_up in sorted(self.sessions[survey])
+                          if (key := (survey, None, treatment, follow_up)) in self.stats and self.stats[key].n]
+                series[treatment] = points
+
+        # Render outside the lock; a bare Figure is safe to use from the server threads
+        fig = Figure(figsize=(8, 4))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        for treatment, points in series.items():
+            if points:
+                months, means, stds = zip(*points)
+                ax.errorbar(months, means, yerr=np.nan_to_num(stds), color=color_mapping[treatment],
+                            linewidth=2, capsize=5, capthick=2, elinewidth=2, label=f'{treatment} Mean ±1 SD')
+        ax.set_title(f'Scores for {survey}')
+        ax.set_ylabel('Total Score')
+        ax.set_xticks(np.arange(0, 13, 2))
+        ax.set_xlim(-0.5, 12.5)
+        ax.set_xlabel('Months')
+        ax.legend(loc='upper right')
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=80)
+
+        with self.lock:
+            self.panel_cache[survey] = (version, buffer.getvalue())
+        return buffer.getvalue()
+
+def summary_cell_id(survey, follow_up, treatment, column):
+    return f"summary|{survey}|{follow_up}|{treatment}|{column}"
+
+def test_cell_id(survey, treatment, follow_up, column):
+    return f"test|{survey}|{treatment}|{follow_up}|{column}"
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset='utf-8'><title>IBS FMT Study - Live</title>
+<style>
+body { font-family: sans-serif; margin: 20px; }
+table { border-collapse: collapse; margin-bottom: 10px; }
+th, td { border: 1px solid black; padding: 5px; text-align: center; }
+th { background-color: #f0f0f0; font-weight: bold; }
+tr:nth-of-type(odd) { background-color: #f9f9f9; }
+td.changed { background-color: #fff3b0; transition: background-color 0s; }
+td { transition: background-color 2s; }
+</style></head>
+<body>
+<h1>IBS FMT Study - Live</h1>
+<p id='status'>Waiting for data...</p>
+<div id='surveys'></div>
+<script>
+let version = 0;
+let generation = null;
+function section(survey) {
+  let div = document.getElementById('survey-' + survey);
+  if (!div) {
+    div = document.createElement('div');
+    div.id = 'survey-' + survey;
+    div.innerHTML = '<h2></h2><div class="tables"></div><img>';
+    div.querySelector('h2').textContent = survey;
+    document.getElementById('surveys').appendChild(div);
+  }
+  return div;
+}
+async function poll() {
+  try {
+    const response = await fetch('/changes?since=' + version);
+    const changes = await response.json();
+    if (generation !== null && changes.generation !== generation) { location.reload(); return; }
+    generation = changes.generation;
+    for (const [survey, table] of Object.entries(changes.tables)) {
+      section(survey).querySelector('.tables').innerHTML = table;
+    }
+    if (version > 0) {
+      for (const [id, text] of Object.entries(changes.cells)) {
+        const cell = document.getElementById(id);
+        if (cell && cell.textContent !== text) {
+          cell.textContent = text;
+          cell.classList.add('changed');
+          setTimeout(() => cell.classList.remove('changed'), 50);
+        }
+      }
+    }
+    for (const [survey, panelVersion] of Object.entries(changes.panels)) {
+      section(survey).querySelector('img').src = '/panel/' + encodeURIComponent(survey) + '.png?v=' + panelVersion;
+    }
+    version = changes.version;
+    document.getElementById('status').textContent =
+      changes.rows + ' rows, last update ' + new Date().toLocaleTimeString();
+  } catch (error) {
+    document.getElementById('status').textContent = 'Dashboard server not reachable';
+  }
+  setTimeout(poll, 500);
+}
+poll();
+</script>
+</body></html>
+"""
+
+def make_handler(dashboard):
+    class DashboardHandler(BaseHTTPRequestHandler):
+        def send(self, body, content_type):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Cache-Control', 'no-store')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/':
+                self.send(PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/changes':
+                since = int(parse_qs(url.query).get('since', ['0'])[0])
+                self.send(json.dumps(dashboard.changes(since)).encode('utf-8'), 'application/json')
+            elif url.path.startswith('/panel/') and url.path.endswith('.png'):
+                survey = url.path[len('/panel/'):-len('.png')]
+                png = dashboard.panel_png(unquote(survey))
+                if png is None:
+                    self.send_error(404)
+                else:
+                    self.send(png, 'image/png')
+            else:
+                self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass  # Keep the console for data updates
+
+    return DashboardHandler
+
+def watch(dashboard, tail, interval):
+    """Poll the data file and fold in whatever has been appended."""
+    while True:
+        reset, text = tail.read_new()
+        if reset:
+            print(f"'{tail.path}' was rewritten; reloading from the start.")
+            with dashboard.lock:
+                dashboard.reset()
+        if text is not None:
+            rows = ibs_data.read_flat(io.BytesIO(text))
+            dashboard.apply_rows(rows)
+            print(f"{time.strftime('%H:%M:%S')} applied {len(rows)} new rows "
+                  f"({dashboard.rows_applied} total)")
+        time.sleep(interval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Live dashboard that updates as rows are appended to the flat scores file.")
+    parser.add_argument('--port', type=int, default=8050, help="Port for the local dashboard (default: 8050)")
+    parser.add_argument('--interval', type=float, default=0.2, help="Seconds between checks of the data file (default: 0.2)")
+    parser.add_argument('--no-browser', action='store_true', help="Don't open the dashboard in a browser")
+    args = parser.parse_args()
+
+    if not os.path.exists(ibs_data.DATA_FILE):
+        print(f"Error: '{ibs_data.DATA_FILE}' not found. Make sure the file is in the 'data' directory.")
+        exit()
+
+    dashboard = Dashboard()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(dashboard))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{args.port}/"
+    print(f"Dashboard running at {url} (Ctrl+C to stop)")
+    if not args.no_browser:
+        webbrowser.open(url)
+
+    try:
+        watch(dashboard, FileTail(ibs_data.DATA_FILE), args.interval)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,146 @@
+import pandas as pd
+import argparse
+import glob
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import ibs_data
+
+# Both datasets are split into one directory per survey and session
+# (hive style: survey_name=DASS/follow_up_number=0/), so a filter on
+# either column only opens the matching files.
+PARTITION_SCHEMA = pa.schema([
+    ('survey_name', pa.string()),
+    ('follow_up_number', pa.int32()),
+])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+
+# Question identifiers are stored with whatever type they have in the data
+QUESTION_COLUMNS = ['q_number', 'q_id']
+
+# Cleaned long table: one row per patient, session and question
+# (q_number and q_id are typed from the data by scores_schema).
+# Patient IDs get 32-bit dictionary indices: a registry can have more than 32767 patients.
+SCORES_SCHEMA = pa.schema([
+    ('survey_name', pa.string()),
+    ('follow_up_number', pa.int32()),
+    ('q_number', pa.string()),
+    ('q_id', pa.string()),
+    ('q_category', pa.dictionary(pa.int16(), pa.string())),
+    ('patient_number', pa.dictionary(pa.int32(), pa.string())),
+    ('patient_fmt_or_p', pa.dictionary(pa.int8(), pa.string())),
+    ('answer', pa.string()),
+    ('score', pa.float64()),
+])
+
+# Per-patient aggregates: summed score per survey (q_category null) and per category
+PATIENT_TOTALS_SCHEMA = pa.schema([
+    ('survey_name', pa.string()),
+    ('follow_up_number', pa.int32()),
+    ('q_category', pa.dictionary(pa.int16(), pa.string())),
+    ('patient_number', pa.dictionary(pa.int32(), pa.string())),
+    ('patient_fmt_or_p', pa.dictionary(pa.int8(), pa.string())),
+    ('total_score', pa.float64()),
+    ('n_items', pa.int32()),
+])
+
+# Columns the analysis scripts use (the free-text answer is left on disk)
+ANALYSIS_COLUMNS = ['survey_name', 'q_number', 'q_id', 'q_category', 'patient_number',
+                    'patient_fmt_or_p', 'follow_up_number', 'score']
+
+def patient_totals(df):
+    """Total score and number of answered items per patient, session, survey and category."""
+    keys = ['survey_name', 'follow_up_number', 'patient_number', 'patient_fmt_or_p']
+    survey_totals = df.groupby(keys, observed=True)['score'].agg(['sum', 'count']).reset_index()
+    survey_totals['q_category'] = None
+    category_totals = df.groupby(keys + ['q_category'], observed=True)['score'].agg(['sum', 'count']).reset_index()
+    totals = pd.concat([survey_totals, category_totals], ignore_index=True)
+    return totals.rename(columns={'sum': 'total_score', 'count': 'n_items'})
+
+def scores_schema(df):
+    """SCORES_SCHEMA with the question columns typed as they are in `df`.
+
+    Nothing guarantees question IDs are numeric, so integer IDs stay
+    integers and anything else is stored as strings.
+    """
+    schema = SCORES_SCHEMA
+    for column in QUESTION_COLUMNS:
+        if pd.api.types.is_integer_dtype(df[column]):
+            arrow_type = pa.int64()
+        elif pd.api.types.is_float_dtype(df[column]):
+            arrow_type = pa.float64()
+        else:
+            arrow_type = pa.string()
+        schema = schema.set(schema.get_field_index(column), pa.field(column, arrow_type))
+    return schema
+
+def to_arrow(df, schema):
+    """Arrow table with exactly the given schema (column order and types)."""
+    df = df.copy()
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            df[field.name] = df[field.name].astype('category')
+        elif pa.types.is_string(field.type):
+            df[field.name] = df[field.name].astype('string')  # keeps missing values missing
+    table = pa.Table.from_pandas(df[schema.names], preserve_index=False)
+    return table.cast(schema)
+
+def write_dataset(table, directory):
+    """Write a partitioned dataset, replacing any previous export."""
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    ds.write_dataset(table, directory, format='parquet', partitioning=PARTITIONING,
+                     basename_template='part-{i}.parquet')
+
+def export(df, directory=ibs_data.PARQUET_DIR):
+    """Write the cleaned long table and per-patient totals as partitioned Parquet."""
+    if 'answer' not in df.columns:
+        # The normalised source does not load the free-text answers
+        df = df.assign(answer=None)
+    write_dataset(to_arrow(df, scores_schema(df)), os.path.join(directory, 'scores'))
+    write_dataset(to_arrow(patient_totals(df), PATIENT_TOTALS_SCHEMA), os.path.join(directory, 'patient_totals'))
+
+def read_dataset(directory, filters=None, columns=None):
+    """Read a partitioned dataset, pushing filters down to partitions and row groups.
+
+    `filters` use the pandas/pyarrow list form, e.g.
+    [('survey_name', '==', 'IBS-SSS'), ('follow_up_number', 'in', [0, 4])].
+    Partitions that cannot match are never opened, and only `columns`
+    (default: all) are decoded.
+    """
+    # Column types come from the files themselves, partition columns from PARTITIONING
+    dataset = ds.dataset(directory, format='parquet', partitioning=PARTITIONING)
+    expression = pq.filters_to_expression(filters) if filters else None
+    table = dataset.to_table(columns=columns, filter=expression)
+    # Dictionary columns come back as pandas categoricals
+    return table.to_pandas()
+
+def read_scores(filters=None, columns=None, directory=ibs_data.PARQUET_DIR):
+    """Cleaned long table, optionally filtered (see read_dataset)."""
+    return read_dataset(os.path.join(directory, 'scores'), filters, columns)
+
+def read_patient_totals(filters=None, columns=None, directory=ibs_data.PARQUET_DIR):
+    """Per-patient totals, optionally filtered (see read_dataset)."""
+    return read_dataset(os.path.join(directory, 'patient_totals'), filters, columns)
+
+def dataset_files(directory=ibs_data.PARQUET_DIR):
+    """Parquet files of the long table, for change detection."""
+    return sorted(glob.glob(os.path.join(directory, 'scores', '**', '*.parquet'), recursive=True))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the cleaned scores and per-patient totals as partitioned Parquet.")
+    parser.add_argument('--source', choices=[s for s in ibs_data.SOURCES if s != 'parquet'], default='flat',
+                        help="CSV source to export from (default: flat)")
+    parser.add_argument('--output', default=ibs_data.PARQUET_DIR, help=f"Output directory (default: {ibs_data.PARQUET_DIR})")
+    args = parser.parse_args()
+
+    df = ibs_data.load_data(args.source)
+    export(df, args.output)
+
+    print(f"Exported {len(df)} scores for {df['patient_number'].nunique()} patients to:")
+    print(f"1. Long table: {os.path.join(args.output, 'scores')}/survey_name=<survey>/follow_up_number=<session>/")
+    print(f"2. Per-patient totals: {os.path.join(args.output, 'patient_totals')}/survey_name=<survey>/follow_up_number=<session>/")
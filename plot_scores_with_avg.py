@@ -2,27 +2,11 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
+import ibs_data
 
 # Load the dataset
-try:
-    df = pd.read_csv('data/ibs-all-patients-flat-scores.csv')
-except FileNotFoundError:
-    print("Error: 'data/ibs-all-patients-flat-scores.csv' not found. Make sure the file is in the 'data' directory.")
-    exit()
-
-# Data Cleaning and Preparation
-# Convert 'score' to numeric, coercing errors to NaN
-df['score'] = pd.to_numeric(df['score'], errors='coerce')
-
-# Drop rows where 'score' is NaN after conversion
-df.dropna(subset=['score'], inplace=True)
-
-# Ensure 'follow_up_number' and 'patient_number' are of appropriate types
-df['follow_up_number'] = pd.to_numeric(df['follow_up_number'], errors='coerce')
-df.dropna(subset=['follow_up_number'], inplace=True) # Drop if follow_up_number is not valid
-df['patient_number'] = df['patient_number'].astype(str)
-# Ensure patient_fmt_or_p is string and uppercase for consistent mapping
-df['patient_fmt_or_p'] = df['patient_fmt_or_p'].astype(str).str.upper()
+args = ibs_data.parse_source_args()
+df = ibs_data.load_data(args.source)
 
 # Create mapping from follow-up number to months
 follow_up_to_months = {
@@ -56,7 +40,7 @@ for i, survey_name in enumerate(survey_names):
 
     # Sum scores per patient, per follow-up, per survey
     patient_scores_over_time = survey_df.groupby(
-        ['patient_number', 'months', 'patient_fmt_or_p']
+        ['patient_number', 'months', 'patient_fmt_or_p'], observed=True
     )['score'].sum().reset_index()
 
     # Plot individual points and calculate statistics for each treatment
@@ -0,0 +1,205 @@
+import pandas as pd
+import numpy as np
+from scipy import stats
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+import random_streams
+import ibs_data
+
+ANALYSIS_NAME = 'power_simulation'
+
+# Create mapping from follow-up number to months
+follow_up_to_months = {
+    0: 0,   # baseline
+    1: 1,   # 1 month
+    2: 3,   # 3 months
+    3: 6,   # 6 months
+    4: 12   # 12 months
+}
+
+def get_observed_pairs(df, survey_name, follow_up):
+    """Return per-patient (baseline, follow-up) total scores for one survey.
+
+    The result has one row per patient with both sessions, and columns
+    'Treatment', 'Baseline' and 'Follow-up'.
+    """
+    survey_df = df[df['survey_name'] == survey_name]
+    totals = survey_df.groupby(['patient_number', 'patient_fmt_or_p', 'follow_up_number'], observed=True)['score'].sum()
+    totals = totals.unstack('follow_up_number')
+    if 0 not in totals.columns or follow_up not in totals.columns:
+        return pd.DataFrame(columns=['Treatment', 'Baseline', 'Follow-up'])
+
+    pairs = totals[[0, follow_up]].dropna()
+    pairs.columns = ['Baseline', 'Follow-up']
+    pairs = pairs.reset_index(level='patient_fmt_or_p').rename(columns={'patient_fmt_or_p': 'Treatment'})
+    return pairs
+
+def simulate_chunk(change, n_per_arm, effect_size, n_sims, alpha, root_seed, survey_name, follow_up, chunk):
+    """Count significant trials in one chunk of a (sample size, effect size) cell.
+
+    Synthetic patients are drawn with replacement from the observed
+    change scores (follow-up minus baseline total), centred so that both
+    arms share the null response. The FMT arm is then shifted by
+    `effect_size` score points. All `n_sims` trials are tested at once.
+
+    Each arm draws from its own stream keyed by survey, arm, follow-up and
+    chunk, so the same patients are reused across the sample size and
+    effect size grid (common random numbers) and any cell can be rerun alone.
+    """
+    fmt_rng = random_streams.generator(root_seed, ANALYSIS_NAME, survey_name, 'FMT', follow_up, chunk)
+    placebo_rng = random_streams.generator(root_seed, ANALYSIS_NAME, survey_name, 'PLACEBO', follow_up, chunk)
+    n_observed = len(change)
+
+    # Draw both arms for every trial in one go: shape (n_sims, n_per_arm)
+    fmt_idx = fmt_rng.integers(0, n_observed, size=(n_sims, n_per_arm))
+    placebo_idx = placebo_rng.integers(0, n_observed, size=(n_sims, n_per_arm))
+
+    fmt_change = change[fmt_idx] + effect_size
+    placebo_change = change[placebo_idx]
+
+    # Resampled cohorts always contain tied differences, for which scipy's
+    # 'auto' method falls back to a per-trial permutation test. Use the
+    # tie-corrected normal approximation so all trials stay vectorized.
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # Within-arm test: follow-up vs baseline in the FMT arm
+        fmt_p = stats.wilcoxon(fmt_change, zero_method='wilcox', method='approx', axis=1).pvalue
+        # Between-arm test: change scores, FMT vs placebo
+        between_p = stats.mannwhitneyu(fmt_change, placebo_change, alternative='two-sided', method='asymptotic', axis=1).pvalue
+
+    # Trials where every difference is zero give NaN and count as not significant
+    fmt_significant = np.nan_to_num(fmt_p, nan=1.0) < alpha
+    between_significant = np.nan_to_num(between_p, nan=1.0) < alpha
+
+    return int(fmt_significant.sum()), int(between_significant.sum())
+
+def run_simulation(pairs, survey_name, follow_up, sample_sizes, effect_sizes, n_sims, alpha,
+                   root_seed, chunk_size, workers):
+    """Run every chunk of every (sample size, effect size) cell on a process pool."""
+    change = (pairs['Follow-up'] - pairs['Baseline']).to_numpy(dtype=float)
+
+    # Centre the change scores within each arm so the resampling pool
+    # carries the observed spread but no treatment effect of its own
+    arm_medians = pd.Series(change, index=pairs.index).groupby(pairs['Treatment'].to_numpy()).transform('median')
+    change = change - arm_medians.to_numpy()
+
+    cells = [(n, effect) for n in sample_sizes for effect in effect_sizes]
+    chunks = random_streams.chunk_sizes(n_sims, chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            (n, effect): [
+                executor.submit(simulate_chunk, change, n, effect, size, alpha,
+                                root_seed, survey_name, follow_up, chunk)
+                for chunk, size in chunks
+            ]
+            for n, effect in cells
+        }
+        results = []
+        for (n, effect), cell_futures in futures.items():
+            counts = np.array([future.result() for future in cell_futures]).sum(axis=0)
+            results.append({
+                'N per arm': n,
+                'Effect Size': effect,
+                'Simulations': n_sims,
+                'Within-arm Power': counts[0] / n_sims,
+                'Between-arm Power': counts[1] / n_sims,
+            })
+
+    results_df = pd.DataFrame(results)
+    change_sd = change.std(ddof=1)
+    results_df['Standardised Effect'] = results_df['Effect Size'] / change_sd if change_sd > 0 else np.nan
+
+    # Record the streams used so any cell can be reproduced on its own
+    results_df['Root Seed'] = root_seed
+    results_df['Chunk Size'] = chunk_size
+    results_df['FMT Spawn Key'] = random_streams.format_spawn_key(ANALYSIS_NAME, survey_name, 'FMT', follow_up)
+    results_df['PLACEBO Spawn Key'] = random_streams.format_spawn_key(ANALYSIS_NAME, survey_name, 'PLACEBO', follow_up)
+    return results_df
+
+def required_sample_sizes(results_df, target_power):
+    """Smallest simulated N per arm reaching the target power, per effect size."""
+    rows = []
+    for effect_size, group in results_df.groupby('Effect Size'):
+        row = {'Effect Size': effect_size}
+        for column in ['Within-arm Power', 'Between-arm Power']:
+            reached = group[group[column] >= target_power]
+            row[column.replace('Power', 'N')] = reached['N per arm'].min() if not reached.empty else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def plot_power_curves(results_df, survey_name, follow_up, target_power, output_file):
+    """Plot power against N per arm, one line per effect size."""
+    fig, axes = plt.subplots(nrows=1, ncols=2, figsize=(12, 5), sharey=True)
+    colors = plt.cm.viridis(np.linspace(0, 0.9, results_df['Effect Size'].nunique()))
+
+    for ax, column in zip(axes, ['Within-arm Power', 'Between-arm Power']):
+        for color, (effect_size, group) in zip(colors, results_df.groupby('Effect Size')):
+            ax.plot(group['N per arm'], group[column], marker='o', color=color, label=f'{effect_size:+g}')
+        ax.axhline(target_power, color='grey', linestyle='--', linewidth=1)
+        ax.set_title(column)
+        ax.set_xlabel('Patients per arm')
+        ax.set_ylim(0, 1.02)
+    axes[0].set_ylabel('Power')
+    axes[1].legend(title='Effect (score points)', bbox_to_anchor=(1.02, 1), loc='upper left')
+
+    fig.suptitle(f'Simulated Power for {survey_name} at {follow_up_to_months.get(follow_up, follow_up)} months', fontsize=14)
+    plt.tight_layout(rect=[0, 0, 1, 0.95])
+    plt.savefig(output_file)
+    plt.close(fig)
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(',')]
+
+def parse_float_list(value):
+    return [float(v) for v in value.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Monte Carlo power and sample-size simulation for the next cohort.")
+    parser.add_argument('--survey', default='IBS-SSS', help="Survey to simulate (default: IBS-SSS)")
+    parser.add_argument('--follow-up', type=int, default=4, help="Follow-up session compared to baseline (default: 4, i.e. 12 months)")
+    parser.add_argument('--sample-sizes', type=parse_int_list, default=list(range(5, 65, 5)),
+                        help="Comma-separated patients per arm to simulate")
+    parser.add_argument('--effect-sizes', type=parse_float_list, default=[0, -25, -50, -75, -100],
+                        help="Comma-separated FMT shifts in score points (negative is improvement)")
+    parser.add_argument('--n-sims', type=int, default=2000, help="Simulated trials per cell")
+    parser.add_argument('--alpha', type=float, default=0.05, help="Significance level")
+    parser.add_argument('--target-power', type=float, default=0.8, help="Power used for the sample-size summary")
+    parser.add_argument('--seed', type=int, default=random_streams.DEFAULT_ROOT_SEED, help="Root random seed")
+    parser.add_argument('--chunk-size', type=int, default=random_streams.DEFAULT_CHUNK_SIZE,
+                        help="Simulated trials per random stream (changing it changes the draws)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: all cores)")
+    ibs_data.add_source_argument(parser)
+    args = parser.parse_args()
+
+    df = ibs_data.load_data(args.source)
+    pairs = get_observed_pairs(df, args.survey, args.follow_up)
+    if len(pairs) < 2:
+        print(f"Error: fewer than 2 patients with baseline and follow-up {args.follow_up} for {args.survey}.")
+        exit()
+
+    print(f"Simulating {args.survey}, follow-up {args.follow_up}, from {len(pairs)} observed patients...")
+    results_df = run_simulation(pairs, args.survey, args.follow_up, args.sample_sizes, args.effect_sizes,
+                                args.n_sims, args.alpha, args.seed, args.chunk_size, args.workers)
+    results_df.insert(0, 'Survey', args.survey)
+    results_df.insert(1, 'Follow-up', args.follow_up)
+
+    # Create results directory if it doesn't exist
+    os.makedirs('results', exist_ok=True)
+
+    output_file = f"results/power_simulation_{args.survey}_fu{args.follow_up}.csv"
+    results_df.to_csv(output_file, index=False)
+
+    plot_file = f"results/power_curves_{args.survey}_fu{args.follow_up}.png"
+    plot_power_curves(results_df, args.survey, args.follow_up, args.target_power, plot_file)
+
+    summary = required_sample_sizes(results_df, args.target_power)
+    print(f"\nPatients per arm needed for {args.target_power:.0%} power (alpha = {args.alpha}):")
+    print(summary.to_string(index=False))
+
+    print(f"\nResults have been saved to:")
+    print(f"1. CSV file: {output_file}")
+    print(f"2. Power curves: {plot_file}")
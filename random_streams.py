@@ -0,0 +1,52 @@
+import numpy as np
+import zlib
+
+# Root seed used by every resampling, permutation or simulation analysis
+# unless a script is given its own with --seed
+DEFAULT_ROOT_SEED = 20240501
+
+# Number of simulated trials or resamples per random stream. Work is split
+# into chunks of this size, never by worker count, so results do not depend
+# on how many processes run them.
+DEFAULT_CHUNK_SIZE = 500
+
+def key_component(value):
+    """Map one key part to a non-negative integer that is stable across runs.
+
+    Python's built-in hash() is salted per process, so strings are hashed
+    with CRC32 instead. Integers (e.g. follow-up numbers) are used as is.
+    """
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        if value < 0:
+            raise ValueError(f"Integer key components must be non-negative, got {value}")
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return key_component(int(value))
+    return zlib.crc32(str(value).upper().encode('utf-8'))
+
+def spawn_key(analysis, survey, arm, follow_up, chunk=0):
+    """Spawn key for the stream of one (analysis, survey, arm, follow-up, chunk) cell."""
+    return tuple(key_component(part) for part in (analysis, survey, arm, follow_up, chunk))
+
+def seed_sequence(root_seed, analysis, survey, arm, follow_up, chunk=0):
+    """SeedSequence for one cell, equivalent to spawning it from the root seed.
+
+    The stream only depends on the root seed and the cell key, so any cell
+    can be recomputed in isolation and gives the same numbers however the
+    work was split across processes.
+    """
+    return np.random.SeedSequence(root_seed, spawn_key=spawn_key(analysis, survey, arm, follow_up, chunk))
+
+def generator(root_seed, analysis, survey, arm, follow_up, chunk=0):
+    """NumPy Generator for one cell."""
+    return np.random.default_rng(seed_sequence(root_seed, analysis, survey, arm, follow_up, chunk))
+
+def chunk_sizes(n_total, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split n_total draws into (chunk index, size) pairs of at most chunk_size."""
+    n_chunks = -(-n_total // chunk_size)
+    return [(chunk, min(chunk_size, n_total - chunk * chunk_size)) for chunk in range(n_chunks)]
+
+def format_spawn_key(analysis, survey, arm, follow_up):
+    """Spawn key of a cell as text for results CSVs, with '*' for the chunk index."""
+    prefix = spawn_key(analysis, survey, arm, follow_up)[:-1]
+    return '.'.join(str(part) for part in prefix) + '.*'
@@ -0,0 +1,265 @@
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import ibs_data
+import random_streams
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIRS = {
+    # Frozen copy of the published real-data outputs (the scripts overwrite results/ on every run)
+    'real': os.path.join(REPO_DIR, 'golden', 'real'),
+    'synthetic': os.path.join(REPO_DIR, 'golden', 'synthetic'),
+    'synthetic_large': os.path.join(REPO_DIR, 'golden', 'synthetic_large'),
+}
+
+# Patients in each synthetic dataset: study size, and registry size for scaling
+SYNTHETIC_PATIENTS = {'synthetic': 21, 'synthetic_large': 2000}
+
+# Each stage runs one script and is held to a wall-time (s) and peak memory (MB) budget,
+# one for study-sized data (the real and small synthetic datasets) and one at registry size.
+# Time budgets are about three times the slowest of repeated runs (at least 4 s), counting
+# runs on a slower machine too, so only a clear slowdown fails and timing noise does not.
+# Peak memory barely varies between runs, so memory budgets are about twice the measured peak.
+# Artifacts listed are compared number by number against the golden files.
+STAGES = [
+    {'name': 'summary_tables', 'script': 'generate_summary_tables.py',
+     'budgets': {'study': (4, 250), 'registry': (12, 630)},
+     'artifacts': ['DASS_summary_table.html', 'IBS-QOL_summary_table.html', 'IBS-SSS_summary_table.html']},
+    {'name': 'wilcoxon_tests', 'script': 'perform_wilcoxon_tests.py',
+     'budgets': {'study': (12, 360), 'registry': (14, 760)},
+     'artifacts': ['wilcoxon_test_results.html', 'wilcoxon_test_results.csv']},
+    {'name': 'wilcoxon_baseline', 'script': 'wilcoxon_baseline_comparison.py',
+     'budgets': {'study': (11, 360), 'registry': (18, 760)},
+     'artifacts': ['wilcoxon_baseline_table.tex', 'wilcoxon_baseline_results.csv']},
+    {'name': 'plot_with_avg', 'script': 'plot_scores_with_avg.py',
+     'budgets': {'study': (10, 450), 'registry': (14, 800)}, 'artifacts': []},
+    {'name': 'plot_lines_only', 'script': 'plot_scores_lines_only.py',
+     'budgets': {'study': (9, 450), 'registry': (13, 800)}, 'artifacts': []},
+    {'name': 'plot_combined', 'script': 'plot_scores_vert.py',
+     'budgets': {'study': (13, 460), 'registry': (320, 1400)}, 'artifacts': []},
+    {'name': 'plot_start_end', 'script': 'plot_scores_hor.py',
+     'budgets': {'study': (10, 450), 'registry': (270, 900)}, 'artifacts': []},
+]
+
+NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?')
+
+def write_synthetic_dataset(data_dir, n_patients=21):
+    """Write a deterministic synthetic study in the same layout as data/."""
+    rng = np.random.default_rng(random_streams.seed_sequence(random_streams.DEFAULT_ROOT_SEED,
+                                                             'synthetic_data', 'ALL', 'ALL', 0))
+    surveys = {
+        'DASS': (21, ['D', 'A', 'S'], 3),
+        'IBS-QOL': (34, ['Dysphoria', 'Body image', 'Health worry', 'Food avoidance'], 4),
+        'IBS-SSS': (5, ['Abdominal Pain', 'Abdominal Distension', 'QoL Interference'], 100),
+    }
+    questions = []
+    for survey_name, (n_questions, categories, max_score) in surveys.items():
+        for q_number in range(1, n_questions + 1):
+            questions.append((survey_name, q_number, len(questions) + 1, categories[q_number % len(categories)], max_score))
+
+    patients = [f'HC{i:02d}' for i in range(1, n_patients + 1)]
+    arms = {patient: ('FMT' if i % 2 else 'placebo') for i, patient in enumerate(patients)}
+
+    rows = []
+    for patient in patients:
+        level = rng.normal(0, 1)
+        for follow_up in range(5):
+            # Some follow-up sessions are missed entirely
+            if follow_up > 0 and rng.random() < 0.15:
+                continue
+            for survey_name, q_number, q_id, category, max_score in questions:
+                noise = rng.normal(0, 0.15)
+                if rng.random() < 0.01:
+                    score = 'n/a'  # unparseable scores are dropped by cleaning
+                else:
+                    score = int(np.clip(round(max_score * (0.5 + 0.15 * level - 0.03 * follow_up + noise)), 0, max_score))
+                rows.append((survey_name, q_number, q_id, category, patient, arms[patient], follow_up, 'answer', score))
+
+    os.makedirs(data_dir, exist_ok=True)
+    columns = ['survey_name', 'q_number', 'q_id', 'q_category', 'patient_number', 'patient_fmt_or_p',
+               'follow_up_number', 'answer', 'score']
+    pd.DataFrame(rows, columns=columns).to_csv(os.path.join(data_dir, os.path.basename(ibs_data.DATA_FILE)), index=False)
+    pd.DataFrame([q[:4] for q in questions], columns=columns[:4]).to_csv(
+        os.path.join(data_dir, os.path.basename(ibs_data.QUESTIONS_FILE)), index=False)
+    pd.DataFrame(list(arms.items()), columns=['patient_number', 'patient_fmt_or_p']).to_csv(
+        os.path.join(data_dir, os.path.basename(ibs_data.PATIENTS_FILE)), index=False)
+
+def run_stage(stage, work_dir, source):
+    """Run one stage's script in work_dir; return (wall seconds, peak memory MB, error)."""
+    with tempfile.TemporaryFile() as stderr:
+        start = time.time()
+        process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, stage['script']), '--source', source],
+                                   cwd=work_dir, stdout=subprocess.DEVNULL, stderr=stderr,
+                                   env=dict(os.environ, MPLBACKEND='Agg'))
+        # wait4 reaps this child alone, giving its own peak RSS
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.time() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        error = None
+        if process.returncode:
+            stderr.seek(0)
+            lines = stderr.read().decode(errors='replace').strip().splitlines()
+            error = lines[-1] if lines else f"exit code {process.returncode}"
+
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, peak_mb, error
+
+def read_cells(path):
+    """Table of strings from an artifact: header list plus list of rows."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+
+    if path.endswith('.csv'):
+        table = pd.read_csv(path, dtype=str, keep_default_na=False)
+        return list(table.columns), table.values.tolist()
+
+    if path.endswith('.html'):
+        header = re.findall(r'<th[^>]*class="col_heading[^"]*"[^>]*>(.*?)</th>', text, re.S)
+        rows = []
+        for row in re.findall(r'<tr>(.*?)</tr>', text, re.S):
+            cells = re.findall(r'<td[^>]*>(.*?)</td>', row, re.S)
+            if cells:
+                rows.append([cell.strip() for cell in cells])
+        return [h.strip() for h in header], rows
+
+    if path.endswith('.tex'):
+        lines = [line.strip() for line in text.splitlines() if line.strip().endswith('\\\\')]
+        cells = [[cell.strip() for cell in line[:-2].split('&')] for line in lines]
+        return cells[0], cells[1:]
+
+    raise ValueError(f"Don't know how to compare {path}")
+
+def cells_match(actual, expected):
+    """True if two cells agree: same text, numbers within the printed precision."""
+    actual_numbers = NUMBER.findall(actual)
+    expected_numbers = NUMBER.findall(expected)
+    if NUMBER.sub('#', actual) != NUMBER.sub('#', expected) or len(actual_numbers) != len(expected_numbers):
+        return False
+    for a, e in zip(actual_numbers, expected_numbers):
+        # Allow one unit in the last printed decimal place, to absorb rounding
+        decimals = max(len(x.split('.')[1]) if '.' in x and 'e' not in x.lower() else 0 for x in (a, e))
+        tolerance = 10.0 ** -decimals * 1.0001 if decimals else 0.0
+        a, e = float(a), float(e)
+        if abs(a - e) > max(tolerance, 1e-9 * max(abs(a), abs(e)), 1e-12):
+            return False
+    return True
+
+def unique_headers(header):
+    """Suffix repeated column names (the LaTeX table has two 'Follow-up' columns)."""
+    seen = {}
+    unique = []
+    for name in header:
+        seen[name] = seen.get(name, 0) + 1
+        unique.append(name if seen[name] == 1 else f"{name} ({seen[name]})")
+    return unique
+
+def compare_artifact(actual_path, golden_path):
+    """List of mismatch descriptions (empty if the artifact matches).
+
+    Columns are matched by header, so golden files with fewer columns
+    (e.g. tables published before a column was added) still compare.
+    """
+    actual_header, actual_rows = read_cells(actual_path)
+    golden_header, golden_rows = read_cells(golden_path)
+    actual_header, golden_header = unique_headers(actual_header), unique_headers(golden_header)
+    if len(actual_rows) != len(golden_rows):
+        return [f"{len(actual_rows)} rows, golden has {len(golden_rows)}"]
+
+    mismatches = []
+    common = [col for col in golden_header if col in actual_header]
+    missing = [col for col in golden_header if col not in actual_header]
+    if missing:
+        mismatches.append(f"missing columns {missing}")
+    for i, (actual_row, golden_row) in enumerate(zip(actual_rows, golden_rows)):
+        for col in common:
+            a = actual_row[actual_header.index(col)]
+            e = golden_row[golden_header.index(col)]
+            if not cells_match(a, e):
+                mismatches.append(f"row {i + 1}, {col}: {a!r} != golden {e!r}")
+    return mismatches
+
+def check_dataset(dataset, data_dir, source, update_golden):
+    """Regenerate every stage for one dataset; return a list of result rows."""
+    golden_dir = GOLDEN_DIRS[dataset]
+    scale = 'registry' if dataset == 'synthetic_large' else 'study'
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copytree(data_dir, os.path.join(work_dir, 'data'))
+        if source == 'parquet':
+            # Export from the copied CSVs, so the stages read a fresh Parquet dataset
+            subprocess.run([sys.executable, os.path.join(REPO_DIR, 'parquet_store.py')],
+                           cwd=work_dir, stdout=subprocess.DEVNULL, check=True)
+        for stage in STAGES:
+            elapsed, peak_mb, error = run_stage(stage, work_dir, source)
+            seconds, memory_mb = stage['budgets'][scale]
+            problems = [error] if error else []
+            if elapsed > seconds:
+                problems.append(f"took {elapsed:.1f}s, budget {seconds}s")
+            if peak_mb > memory_mb:
+                problems.append(f"used {peak_mb:.0f} MB, budget {memory_mb} MB")
+
+            for artifact in stage['artifacts']:
+                actual_path = os.path.join(work_dir, 'results', artifact)
+                golden_path = os.path.join(golden_dir, artifact)
+                if not os.path.exists(actual_path):
+                    problems.append(f"{artifact} was not generated")
+                elif update_golden:
+                    os.makedirs(golden_dir, exist_ok=True)
+                    shutil.copy(actual_path, golden_path)
+                elif not os.path.exists(golden_path):
+                    problems.append(f"{artifact}: no golden file")
+                else:
+                    problems.extend(f"{artifact}: {m}" for m in compare_artifact(actual_path, golden_path)[:5])
+
+            results.append({
+                'Dataset': dataset,
+                'Stage': stage['name'],
+                'Seconds': round(elapsed, 2),
+                'Peak MB': round(peak_mb),
+                'Status': 'FAIL' if problems else 'ok',
+                'Problems': '; '.join(problems),
+            })
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Regenerate all artifacts and check them against golden files and time/memory budgets.")
+    parser.add_argument('--dataset', choices=['real', 'synthetic', 'synthetic_large', 'all'], default='all',
+                        help="Which dataset to check (real needs data/ to exist)")
+    parser.add_argument('--update-golden', action='store_true',
+                        help="Overwrite the synthetic golden files with freshly generated ones "
+                             "(the real ones only with --dataset real)")
+    ibs_data.add_source_argument(parser)
+    args = parser.parse_args()
+
+    all_results = []
+    for dataset, n_patients in SYNTHETIC_PATIENTS.items():
+        if args.dataset in (dataset, 'all'):
+            with tempfile.TemporaryDirectory() as data_dir:
+                write_synthetic_dataset(data_dir, n_patients)
+                all_results += check_dataset(dataset, data_dir, args.source, args.update_golden)
+
+    if args.dataset in ('real', 'all'):
+        real_data_dir = os.path.join(REPO_DIR, 'data')
+        if os.path.exists(os.path.join(REPO_DIR, ibs_data.DATA_FILE)):
+            # The real goldens are only refreshed when asked for by name
+            all_results += check_dataset('real', real_data_dir, args.source,
+                                         update_golden=args.update_golden and args.dataset == 'real')
+        else:
+            print(f"Skipping real dataset: '{ibs_data.DATA_FILE}' not found.")
+
+    results_df = pd.DataFrame(all_results)
+    print(results_df.to_string(index=False))
+
+    failed = (results_df['Status'] == 'FAIL').sum() if not results_df.empty else 0
+    print(f"\n{len(results_df) - failed} stages passed, {failed} failed.")
+    sys.exit(1 if failed else 0)
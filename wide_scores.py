@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+from dataclasses import dataclass
+
+@dataclass
+class WideScores:
+    """Patient x session total scores for one survey (or one survey category).
+
+    Rows are integer-coded patients and columns are sessions, so paired
+    baseline/follow-up comparisons are plain column operations instead of
+    aligning string patient IDs between two groupbys.
+
+    Attributes:
+        survey: Survey name.
+        category: Question category, or None for the survey total.
+        patients: Patient ID of each row.
+        arms: Treatment group of each row ('FMT' or 'PLACEBO').
+        sessions: Follow-up number of each column, sorted.
+        totals: Summed score per patient and session, NaN where missing.
+        valid: True where the patient answered at least one question
+            of this survey/category in that session.
+    """
+    survey: str
+    category: object
+    patients: np.ndarray
+    arms: np.ndarray
+    sessions: np.ndarray
+    totals: np.ndarray
+    valid: np.ndarray
+
+    @property
+    def valid_bits(self):
+        """Validity as one integer bitmask per patient (bit j set = session j present)."""
+        weights = np.left_shift(1, np.arange(len(self.sessions), dtype=np.int64))
+        return self.valid.astype(np.int64) @ weights
+
+    def session_index(self, follow_up):
+        """Column index of a follow-up number, or None if it never occurs."""
+        matches = np.flatnonzero(self.sessions == follow_up)
+        return int(matches[0]) if len(matches) else None
+
+    def arm_mask(self, arm=None):
+        """Boolean row mask for one treatment group (all rows if arm is None)."""
+        if arm is None:
+            return np.ones(len(self.patients), dtype=bool)
+        return self.arms == arm
+
+    def sessions_with_data(self, arm=None):
+        """Sessions in which at least one patient of the arm has scores."""
+        return self.sessions[self.valid[self.arm_mask(arm)].any(axis=0)]
+
+    def completeness(self, arm=None):
+        """Number of patients with scores in each session."""
+        return self.valid[self.arm_mask(arm)].sum(axis=0)
+
+    def change_scores(self, follow_up, baseline=0):
+        """Follow-up minus baseline total per patient, NaN unless both are present."""
+        b = self.session_index(baseline)
+        f = self.session_index(follow_up)
+        if b is None or f is None:
+            return np.full(len(self.patients), np.nan)
+        both = self.valid[:, b] & self.valid[:, f]
+        return np.where(both, self.totals[:, f] - self.totals[:, b], np.nan)
+
+    def paired(self, follow_up, baseline=0, arm=None):
+        """Rows, baseline totals and follow-up totals of patients with both sessions.
+
+        Returns (rows, baseline_scores, follow_up_scores) where rows are the
+        integer patient codes, in patient ID order.
+        """
+        b = self.session_index(baseline)
+        f = self.session_index(follow_up)
+        if b is None or f is None:
+            empty = np.array([], dtype=float)
+            return np.array([], dtype=np.int64), empty, empty
+        rows = np.flatnonzero(self.valid[:, b] & self.valid[:, f] & self.arm_mask(arm))
+        return rows, self.totals[rows, b], self.totals[rows, f]
+
+def build_wide_scores(df, by_category=False):
+    """Build WideScores for every survey (and, optionally, every category).
+
+    `df` is the cleaned flat scores table. Returns a dict keyed by
+    (survey_name, category); category is None for the survey totals, which
+    are always included. All tables share the same patient rows and session
+    columns.
+    """
+    # A patient is keyed together with their arm, matching the scripts that
+    # filter rows by treatment group before grouping by patient
+    patient_keys = pd.MultiIndex.from_frame(df[['patient_number', 'patient_fmt_or_p']])
+    patient_codes, patient_index = pd.factorize(patient_keys, sort=True)
+    session_codes, sessions = pd.factorize(df['follow_up_number'], sort=True)
+    patients = patient_index.get_level_values(0).to_numpy()
+    arms = patient_index.get_level_values(1).to_numpy()
+    scores = df['score'].to_numpy(dtype=float)
+
+    groups = [(df['survey_name'].to_numpy(), None)]
+    if by_category:
+        groups.append((df['survey_name'].to_numpy(), df['q_category'].astype(str).to_numpy()))
+
+    wide = {}
+    for survey_values, category_values in groups:
+        if category_values is None:
+            keys = pd.Series(survey_values)
+        else:
+            keys = pd.Series(list(zip(survey_values, category_values)))
+        group_codes, group_index = pd.factorize(keys, sort=True)
+
+        # Scatter-add every row into a (group, patient, session) cube at once
+        shape = (len(group_index), len(patients), len(sessions))
+        flat = np.ravel_multi_index((group_codes, patient_codes, session_codes), shape)
+        totals = np.bincount(flat, weights=scores, minlength=np.prod(shape)).reshape(shape)
+        counts = np.bincount(flat, minlength=np.prod(shape)).reshape(shape)
+
+        for g, key in enumerate(group_index):
+            survey, category = (key, None) if category_values is None else key
+            valid = counts[g] > 0
+            wide[(survey, category)] = WideScores(
+                survey=survey,
+                category=category,
+                patients=patients,
+                arms=arms,
+                sessions=np.asarray(sessions),
+                totals=np.where(valid, totals[g], np.nan),
+                valid=valid,
+            )
+    return wide
@@ -1,25 +1,15 @@
 import pandas as pd
 import numpy as np
 from scipy import stats
+import argparse
 import os
+import ibs_data
+import effect_sizes
+import random_streams
+from wide_scores import build_wide_scores
 
-# Load the dataset
-try:
-    df = pd.read_csv('data/ibs-all-patients-flat-scores.csv')
-except FileNotFoundError:
-    print("Error: 'data/ibs-all-patients-flat-scores.csv' not found. Make sure the file is in the 'data' directory.")
-    exit()
-
-# Data Cleaning and Preparation
-df['score'] = pd.to_numeric(df['score'], errors='coerce')
-df.dropna(subset=['score'], inplace=True)
-df['follow_up_number'] = pd.to_numeric(df['follow_up_number'], errors='coerce')
-df.dropna(subset=['follow_up_number'], inplace=True)
-df['patient_number'] = df['patient_number'].astype(str)
-df['patient_fmt_or_p'] = df['patient_fmt_or_p'].astype(str).str.upper()
-
-# Create results directory if it doesn't exist
-os.makedirs('results', exist_ok=True)
+# Between-arm statistic, given once per survey and follow-up
+CLIFFS_DELTA = "Cliff's Delta (FMT vs PLACEBO)"
 
 def perform_wilcoxon_test(baseline_scores, follow_up_scores):
     """Perform Wilcoxon test and return results."""
@@ -54,36 +44,46 @@ def format_p_value(p_value):
         return "< 0.001"
     return f"{p_value:.3f}"
 
-def generate_results_table():
-    """Generate results table for all surveys and follow-ups."""
+def generate_results_table(df, hl_ci='exact', root_seed=random_streams.DEFAULT_ROOT_SEED):
+    """Generate results table for all surveys and follow-ups.
+
+    Effect sizes are added for every row: the matched-pairs rank-biserial
+    correlation and the Hodges-Lehmann shift with a 95% CI (`hl_ci` is
+    'exact' or 'bootstrap'; bootstrap resamples come from `root_seed`,
+    which is recorded with the chunk size and spawn keys). Cliff's delta of FMT vs placebo change scores
+    is a between-arm statistic, so it is given once per survey and
+    follow-up, on the first row of that follow-up. All effect sizes are
+    computed for every cell at once after the tests.
+    """
     # Store all results
     all_results = []
+    all_differences = []
+    
+    # FMT and placebo change scores per (survey, follow-up), for Cliff's delta
+    between_arm_cells = {}
+    
+    # Wide patient x session totals per survey
+    wide_scores = build_wide_scores(df)
     
     # Process each survey
     for survey_name in sorted(df['survey_name'].unique()):
-        survey_df = df[df['survey_name'] == survey_name].copy()
+        survey_scores = wide_scores[(survey_name, None)]
+        for follow_up in survey_scores.sessions[survey_scores.sessions != 0]:
+            change = survey_scores.change_scores(follow_up)
+            between_arm_cells[(survey_name, follow_up)] = (change[survey_scores.arm_mask('FMT')],
+                                                           change[survey_scores.arm_mask('PLACEBO')])
         
         # Process each treatment group
         for treatment in ['FMT', 'PLACEBO']:
-            treatment_df = survey_df[survey_df['patient_fmt_or_p'] == treatment]
-            
-            # Get baseline scores (follow-up 0)
-            baseline_scores = treatment_df[treatment_df['follow_up_number'] == 0].groupby('patient_number')['score'].sum()
-            
-            # Compare each follow-up to baseline
-            for follow_up in sorted(treatment_df['follow_up_number'].unique()):
+            # Compare each follow-up to baseline (follow-up 0)
+            for follow_up in survey_scores.sessions_with_data(treatment):
                 if follow_up == 0:  # Skip comparing baseline to itself
                     continue
-                    
-                follow_up_scores = treatment_df[treatment_df['follow_up_number'] == follow_up].groupby('patient_number')['score'].sum()
                 
-                # Ensure we only compare patients who have both baseline and follow-up scores
-                common_patients = baseline_scores.index.intersection(follow_up_scores.index)
+                # Only patients who have both baseline and follow-up scores
+                common_patients, baseline_subset, follow_up_subset = survey_scores.paired(follow_up, arm=treatment)
                 if len(common_patients) < 2:  # Need at least 2 patients for the test
                     continue
-                    
-                baseline_subset = baseline_scores[common_patients]
-                follow_up_subset = follow_up_scores[common_patients]
                 
                 # Calculate mean changes
                 mean_baseline = baseline_subset.mean()
@@ -93,6 +93,9 @@ def generate_results_table():
                 # Perform Wilcoxon test
                 result = perform_wilcoxon_test(baseline_subset, follow_up_subset)
                 
+                # Paired differences, for the effect sizes below
+                all_differences.append(follow_up_subset - baseline_subset)
+                
                 # Store results
                 all_results.append({
                     'Survey': survey_name,
@@ -107,7 +110,33 @@ def generate_results_table():
                     'Significant': result['significant']
                 })
     
-    return pd.DataFrame(all_results)
+    results_df = pd.DataFrame(all_results)
+    if results_df.empty:
+        return results_df
+    
+    # Within-arm effect sizes for every row at once
+    results_df['Rank-Biserial r'] = effect_sizes.rank_biserial(effect_sizes.pad_cells(all_differences))
+    stream_keys = [('hodges_lehmann', survey, treatment, follow_up) for survey, treatment, follow_up
+                   in zip(results_df['Survey'], results_df['Treatment'], results_df['Follow-up'])]
+    results_df['HL Shift'], results_df['HL CI Low'], results_df['HL CI High'] = effect_sizes.hodges_lehmann_cells(
+        all_differences, method=hl_ci, root_seed=root_seed, stream_keys=stream_keys)
+    
+    # Between-arm Cliff's delta for every (survey, follow-up) at once, on its first row only
+    cells = list(between_arm_cells)
+    deltas = effect_sizes.cliffs_delta_cells([between_arm_cells[c][0] for c in cells],
+                                             [between_arm_cells[c][1] for c in cells])
+    delta_by_cell = pd.Series(deltas, index=pd.MultiIndex.from_tuples(cells))
+    first_row = ~results_df.duplicated(['Survey', 'Follow-up'])
+    cell_index = pd.MultiIndex.from_frame(results_df[['Survey', 'Follow-up']])
+    results_df[CLIFFS_DELTA] = delta_by_cell.reindex(cell_index).to_numpy()
+    results_df.loc[~first_row, CLIFFS_DELTA] = np.nan
+    
+    # Random stream of each row's bootstrap CI
+    results_df['Root Seed'] = root_seed
+    results_df['Chunk Size'] = random_streams.DEFAULT_CHUNK_SIZE
+    results_df['HL Spawn Key'] = [random_streams.format_spawn_key(*key) for key in stream_keys]
+    
+    return results_df
 
 def generate_latex_table(results_df):
     """Generate LaTeX table from results DataFrame."""
@@ -118,9 +147,10 @@ def generate_latex_table(results_df):
     latex_table.append("\\label{tab:wilcoxon_baseline}")
     
     # Add table header
-    latex_table.append("\\begin{tabular}{llrrrrrrr}")
+    latex_table.append("\\begin{tabular}{llrrrrrrrrrr}")
     latex_table.append("\\hline")
-    latex_table.append("Survey & Treatment & Follow-up & N & Baseline & Follow-up & Change & W & p-value \\\\")
+    latex_table.append("Survey & Treatment & Follow-up & N & Baseline & Follow-up & Change & W & p-value & "
+                       "$r_{rb}$ & HL (95\\% CI) & $\\delta$ FMT vs PLACEBO \\\\")
     latex_table.append("\\hline")
     
     # Add data rows
@@ -132,9 +162,17 @@ def generate_latex_table(results_df):
         # Format the statistic, using --- for NaN values
         statistic = "---" if pd.isna(row['Statistic']) else f"{row['Statistic']:.1f}"
         
+        # Effect sizes, using --- where undefined
+        rank_biserial = "---" if pd.isna(row['Rank-Biserial r']) else f"{row['Rank-Biserial r']:+.2f}"
+        hodges_lehmann = ("---" if pd.isna(row['HL Shift']) else
+                          f"{row['HL Shift']:+.1f} [{row['HL CI Low']:.1f}, {row['HL CI High']:.1f}]")
+        cliffs_delta = row[CLIFFS_DELTA]
+        cliffs_delta = "---" if pd.isna(cliffs_delta) else f"{cliffs_delta:+.2f}"
+        
         row_str = (f"{row['Survey']} & {row['Treatment']} & {row['Follow-up']} & {row['N']} & "
                   f"{row['Baseline Mean']:.1f} & {row['Follow-up Mean']:.1f} & "
-                  f"{row['Mean Change']:+.1f} & {statistic} & {p_value} \\\\")
+                  f"{row['Mean Change']:+.1f} & {statistic} & {p_value} & "
+                  f"{rank_biserial} & {hodges_lehmann} & {cliffs_delta} \\\\")
         latex_table.append(row_str)
     
     latex_table.append("\\hline")
@@ -143,18 +181,31 @@ def generate_latex_table(results_df):
     
     return "\n".join(latex_table)
 
-# Generate results
-results_df = generate_results_table()
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Wilcoxon signed rank tests and effect sizes against baseline.")
+    parser.add_argument('--hl-ci', choices=['exact', 'bootstrap'], default='exact',
+                        help="Hodges-Lehmann confidence interval method (default: exact)")
+    parser.add_argument('--seed', type=int, default=random_streams.DEFAULT_ROOT_SEED,
+                        help="Root random seed for bootstrap CIs")
+    ibs_data.add_source_argument(parser)
+    args = parser.parse_args()
+    df = ibs_data.load_data(args.source)
+
+    # Create results directory if it doesn't exist
+    os.makedirs('results', exist_ok=True)
+
+    # Generate results
+    results_df = generate_results_table(df, hl_ci=args.hl_ci, root_seed=args.seed)
 
-# Generate and save LaTeX table
-latex_table = generate_latex_table(results_df)
-output_file = "results/wilcoxon_baseline_table.tex"
-with open(output_file, 'w') as f:
-    f.write(latex_table)
+    # Generate and save LaTeX table
+    latex_table = generate_latex_table(results_df)
+    output_file = "results/wilcoxon_baseline_table.tex"
+    with open(output_file, 'w') as f:
+        f.write(latex_table)
 
-# Also save as CSV for easy access
-results_df.to_csv("results/wilcoxon_baseline_results.csv", index=False)
+    # Also save as CSV for easy access
+    results_df.to_csv("results/wilcoxon_baseline_results.csv", index=False)
 
-print(f"\nResults have been saved to:")
-print(f"1. LaTeX table: {output_file}")
-print(f"2. CSV file: results/wilcoxon_baseline_results.csv") 
\ No newline at end of file
+    print(f"\nResults have been saved to:")
+    print(f"1. LaTeX table: {output_file}")
+    print(f"2. CSV file: results/wilcoxon_baseline_results.csv")